@@ -0,0 +1,196 @@
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from app.utils.cassette import install_cassette
+from app.utils.agents import (
+    create_classifier_agent,
+    create_duckduckgo_agent,
+    create_tavily_agent,
+    create_coordinator_agent
+)
+from app.utils.classification import (
+    CLASSIFICATION_BATCH_SIZE,
+    classify_many_async,
+    classify_question
+)
+from app.utils.cordination import create_question_classifier_crew
+from app.utils.event_log import LEVELS, event_log
+from app.utils.knn import knn_classifier
+from app.utils.llm_router import llm_router
+from app.utils.metrics import metrics, recent_traces
+from app.utils.routing import pipeline_router
+
+readiness = {"ready": False, "error": None}
+
+
+class ClassifyRequest(BaseModel):
+    """Request body for single-question classification."""
+    question: str = Field(..., min_length=1, description="Question to classify")
+
+
+class BatchClassifyRequest(BaseModel):
+    """Request body for bulk classification."""
+    questions: List[str] = Field(..., min_length=1, description="Questions to classify, in order")
+    batch_size: int = Field(CLASSIFICATION_BATCH_SIZE, ge=1, le=100, description="Questions per LLM request")
+
+
+class AnalyzeRequest(BaseModel):
+    """Request body for a full QuestionClassifierCrew analysis."""
+    question: str = Field(..., min_length=1, description="Question to analyze")
+    concurrent: Optional[bool] = Field(None, description="Run classification and searches concurrently")
+
+
+class LogLevelRequest(BaseModel):
+    """Request body for changing the event log verbosity."""
+    level: str = Field(..., description=f"One of {', '.join(LEVELS)}")
+
+
+def warm_up():
+    """Build the kNN index and agent templates so the first request does not pay for them"""
+    knn_classifier.index
+    for create_agent in (create_classifier_agent, create_duckduckgo_agent,
+                         create_tavily_agent, create_coordinator_agent):
+        create_agent()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    install_cassette()
+
+    async def prepare():
+        try:
+            await asyncio.to_thread(warm_up)
+            readiness["ready"] = True
+        except Exception as e:
+            readiness["error"] = str(e)
+
+    warm_up_task = asyncio.create_task(prepare())
+    yield
+    warm_up_task.cancel()
+
+
+app = FastAPI(title="Question Prism API", lifespan=lifespan)
+
+
+@app.get("/health")
+async def health():
+    """Liveness: the process is up and serving requests"""
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness: shared resources are built and the service can take traffic"""
+    if not readiness["ready"]:
+        return JSONResponse(status_code=503, content={"status": "starting", "error": readiness["error"]})
+    return {"status": "ready"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Stage latency histograms and token/cost counters in Prometheus text format"""
+    return PlainTextResponse(metrics.prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/traces")
+async def traces(limit: int = 20):
+    """The most recent per-request traces, newest first"""
+    return {"traces": list(recent_traces)[::-1][:limit]}
+
+
+@app.get("/routing")
+async def routing():
+    """Per-category pipeline plans and what they saved against full-pipeline runs"""
+    return {"enabled": pipeline_router.enabled, "categories": pipeline_router.report()}
+
+
+@app.get("/providers")
+async def providers():
+    """LLM provider circuit states and per-agent latency, hedge and failover counts"""
+    return llm_router.stats()
+
+
+@app.get("/logging")
+async def logging_status():
+    """Event log level, file and writer queue"""
+    return event_log.stats()
+
+
+@app.put("/logging")
+async def set_logging_level(request: LogLevelRequest):
+    """Change the event log level without restarting"""
+    try:
+        event_log.set_level(request.level)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return event_log.stats()
+
+
+@app.post("/classify")
+async def classify(request: ClassifyRequest):
+    category = await run_in_threadpool(classify_question, request.question)
+    return {"question": request.question, "category": category}
+
+
+@app.post("/classify/batch")
+async def classify_batch(request: BatchClassifyRequest):
+    start = time.perf_counter()
+    categories = await classify_many_async(request.questions, request.batch_size)
+    return {
+        "results": [
+            {"question": question, "category": category}
+            for question, category in zip(request.questions, categories)
+        ],
+        "seconds": time.perf_counter() - start
+    }
+
+
+@app.post("/analyze")
+async def analyze(request: AnalyzeRequest):
+    crew_instance = create_question_classifier_crew(concurrent=request.concurrent)
+    answer = await run_in_threadpool(crew_instance.run, request.question)
+    return {
+        "question": request.question,
+        "answer": answer,
+        "seconds": crew_instance.last_run_seconds,
+        "trace": crew_instance.last_trace
+    }
+
+
+@app.post("/analyze/stream")
+async def analyze_stream(request: AnalyzeRequest):
+    """Stream analysis events (status, token, metrics, error) as server-sent events"""
+    crew_instance = create_question_classifier_crew(concurrent=request.concurrent)
+
+    async def events():
+        async for event in crew_instance.stream_run(request.question):
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/ocr")
+async def ocr(file: UploadFile = File(...)):
+    """OCR an image, PDF or multi-page TIFF and return the text and questions of each page"""
+    # Imported on first use so API workers that never OCR do not load EasyOCR
+    from PIL import Image, UnidentifiedImageError
+    from pypdfium2 import PdfiumError
+    from app.utils.ocr import ocr_document
+
+    file_bytes = await file.read()
+    try:
+        pages = await run_in_threadpool(lambda: list(ocr_document(file_bytes)))
+    except (UnidentifiedImageError, Image.DecompressionBombError, PdfiumError, ValueError) as e:
+        # Only a file that cannot be decoded is the client's fault; OCR, model and cache failures stay 500s
+        raise HTTPException(status_code=422, detail=f"Could not read {file.filename}: {str(e)}")
+    return {"filename": file.filename, "pages": pages}
@@ -0,0 +1,289 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from itertools import cycle, islice
+from typing import Callable, List, Optional, Tuple
+import numpy as np
+
+BENCHMARK_OUTPUT_DIR = os.getenv("BENCHMARK_OUTPUT_DIR", "logs/benchmarks")
+SCENARIOS = ("analysis", "batch", "ocr")
+
+# Question shapes that the local rules and nearest-neighbour stage mostly cannot decide,
+# so the benchmark exercises the LLM path
+QUESTION_TEMPLATES = [
+    "How does {topic} influence outcomes in case {n}?",
+    "What role does {topic} play in scenario {n}?",
+    "Why might {topic} matter for project {n}?",
+    "Discuss the impact of {topic} on region {n}."
+]
+TOPICS = ["supply chains", "urban planning", "soil chemistry", "team dynamics", "memory hierarchies",
+          "river ecology", "tax policy", "protein folding", "opera history", "wind turbines"]
+
+
+def _letters(number: int) -> str:
+    # Digits would trip the "mathematical" rule, so uniqueness tags are spelled in letters
+    tag = ""
+    while True:
+        number, remainder = divmod(number, 26)
+        tag = chr(ord("a") + remainder) + tag
+        if number == 0:
+            return tag
+
+
+def make_questions(count: int, run_id: str) -> List[str]:
+    """Unique questions per run so the classification and search caches never answer them"""
+    return [
+        QUESTION_TEMPLATES[i % len(QUESTION_TEMPLATES)].format(
+            topic=TOPICS[i % len(TOPICS)], n=f"{run_id}{_letters(i)}"
+        )
+        for i in range(count)
+    ]
+
+
+def read_traffic(path: str) -> List[str]:
+    """Questions of the analysis requests in a trace log, in the order they were served.
+
+    path is a trace file, or the shared TRACE_LOG_PATH whose per-process files are merged.
+    """
+    from app.utils.event_log import process_log_files
+
+    traces = []
+    for file_path in [path] if os.path.isfile(path) else process_log_files(path):
+        with open(file_path, encoding="utf-8") as handle:
+            traces += [json.loads(line) for line in handle if line.strip()]
+    traces.sort(key=lambda trace: trace.get("started_at", 0))
+    return [trace["question"] for trace in traces if trace.get("kind") == "analysis" and trace.get("question")]
+
+
+def make_page(number: int, run_id: str) -> bytes:
+    """A synthetic scanned page with a few numbered questions, unique per run"""
+    from PIL import Image, ImageDraw
+
+    image = Image.new("L", (1240, 1754), color=255)
+    draw = ImageDraw.Draw(image)
+    for line in range(5):
+        draw.text((80, 120 + line * 90), f"{line + 1}. What is question {line + 1} of page {number} ({run_id})?",
+                  fill=0)
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def summarize(latencies: List[float], seconds: float, units: int) -> dict:
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (0.0, 0.0, 0.0)
+    return {
+        "throughput": units / seconds if seconds else 0.0,
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99)
+    }
+
+
+def measure(work: Callable[[], Tuple[List[float], int, int]]) -> dict:
+    """Run one scenario level, recording wall time and peak traced memory"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    latencies, units, errors = work()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "units": units,
+        "errors": errors,
+        "seconds": seconds,
+        **summarize(latencies, seconds, units),
+        "peak_memory_mb": peak / 1024 / 1024
+    }
+
+
+def _timed_pool(function, items, concurrency: int) -> Tuple[List[float], int]:
+    def timed(item):
+        start = time.perf_counter()
+        failed = function(item)
+        return time.perf_counter() - start, failed
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed, items))
+    return [latency for latency, _ in outcomes], sum(1 for _, failed in outcomes if failed)
+
+
+def run_analysis(requests: int, concurrency: int, run_id: str, traffic: Optional[List[str]] = None) -> dict:
+    """Full QuestionClassifierCrew runs, one per request, `concurrency` at a time"""
+    from app.utils.cordination import create_question_classifier_crew
+
+    def analyze(question):
+        return create_question_classifier_crew().run(question).startswith("Error processing question")
+
+    def work():
+        questions = list(islice(cycle(traffic), requests)) if traffic else make_questions(requests, run_id)
+        latencies, errors = _timed_pool(analyze, questions, concurrency)
+        return latencies, requests, errors
+
+    return measure(work)
+
+
+def run_batch(questions: int, concurrency: int, batch_size: int, run_id: str) -> dict:
+    """Excel-style bulk classification; latency is per batch request"""
+    from app.utils.classification import classify_many
+    from app.utils.metrics import metrics
+
+    def work():
+        metrics.clear()
+        categories = classify_many(make_questions(questions, run_id), batch_size, max_concurrency=concurrency)
+        batches = next(
+            (histogram for labels, histogram in metrics.histograms.get("stage_duration_seconds", {}).items()
+             if dict(labels).get("stage") == "classification_batch"),
+            None
+        )
+        latencies = list(batches.recent) if batches else []
+        errors = sum(1 for category in categories if category.startswith("Classification Error"))
+        return latencies, questions, errors
+
+    return measure(work)
+
+
+def run_ocr(documents: int, concurrency: int, run_id: str) -> dict:
+    """OCR of synthetic scanned pages, including preprocessing and question splitting"""
+    from app.utils.ocr import ocr_document
+
+    pages = [make_page(i, run_id) for i in range(documents)]
+
+    def read(page):
+        return not list(ocr_document(page))
+
+    def work():
+        latencies, errors = _timed_pool(read, pages, concurrency)
+        return latencies, documents, errors
+
+    return measure(work)
+
+
+def warm_up(traffic: Optional[List[str]] = None):
+    """Build the kNN index and agent templates so the first measured level does not pay for them"""
+    from app.utils.cordination import create_question_classifier_crew
+    from app.utils.classification import classify_many
+
+    if traffic:
+        # A replayed cassette only knows the recorded requests
+        create_question_classifier_crew().run(traffic[0])
+        return
+    create_question_classifier_crew().run(make_questions(1, "warmup")[0])
+    classify_many(make_questions(2, "warmupbatch"), 2)
+
+
+def compare(results: dict, baseline: dict) -> List[str]:
+    """Describe throughput and p95 changes against an earlier results file"""
+    previous = {(entry["scenario"], entry["concurrency"]): entry for entry in baseline.get("results", [])}
+    lines = []
+    for entry in results["results"]:
+        before = previous.get((entry["scenario"], entry["concurrency"]))
+        if not before or "error" in entry or "error" in before:
+            continue
+        throughput = (entry["throughput"] / before["throughput"] - 1) * 100 if before["throughput"] else 0.0
+        p95 = (entry["p95"] / before["p95"] - 1) * 100 if before["p95"] else 0.0
+        lines.append(f"{entry['scenario']:<9} c={entry['concurrency']:<3} "
+                     f"throughput {throughput:+.1f}%  p95 {p95:+.1f}%")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline offline against stub LLM, search and OCR backends.")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16],
+                        help="Concurrency levels to run each scenario at")
+    parser.add_argument("--requests", type=int, default=16, help="Analyses or OCR documents per level")
+    parser.add_argument("--batch-questions", type=int, default=400, help="Questions per batch classification run")
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Mean stub LLM latency in seconds")
+    parser.add_argument("--search-latency", type=float, default=0.3, help="Mean stub search latency in seconds")
+    parser.add_argument("--ocr-latency", type=float, default=0.5, help="Mean stub OCR latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Latency spread as a fraction of the mean")
+    parser.add_argument("--real-ocr", action="store_true", help="Use EasyOCR instead of the OCR stand-in")
+    parser.add_argument("--replay", help="Cassette to serve LLM and search calls from instead of the stand-ins")
+    parser.add_argument("--traffic", default="logs/traces.jsonl",
+                        help="Trace log whose analysis questions are replayed with --replay")
+    parser.add_argument("--time-scale", type=float, default=1.0,
+                        help="Multiplier for the recorded latencies when replaying")
+    parser.add_argument("-o", "--output", help="Results file (default: a timestamped file in logs/benchmarks)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    # Fresh caches so each run measures the pipeline rather than a warm disk cache
+    cache_dir = tempfile.mkdtemp(prefix="benchmark-cache-")
+    for name in ("CLASSIFICATION_CACHE_PATH", "SEARCH_CACHE_PATH", "OCR_CACHE_PATH", "SEMANTIC_CACHE_PATH"):
+        os.environ[name] = os.path.join(cache_dir, f"{name.lower()}.sqlite3")
+    os.environ.setdefault("TRACE_LOG_PATH", "")
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+    from app.utils.stubs import LatencyModel, StubOCRReader, install_stub_backends
+    from app.utils.registry import registry
+
+    traffic = None
+    if args.replay:
+        from app.utils.cassette import install_cassette
+
+        traffic = read_traffic(args.traffic)
+        if not traffic:
+            parser.error(f"{args.traffic}: no analysis requests to replay")
+        install_cassette("replay", args.replay, args.time_scale)
+        registry.replace(("ocr", "reader"), StubOCRReader(LatencyModel(args.ocr_latency, args.jitter, 2)))
+    else:
+        install_stub_backends(args.llm_latency, args.search_latency, args.ocr_latency, args.jitter)
+    if args.real_ocr:
+        registry.discard(("ocr", "reader"))
+
+    warm_up(traffic)
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        "config": vars(args),
+        "results": []
+    }
+
+    for scenario in args.scenarios:
+        for concurrency in args.concurrency:
+            run_id = f"{_letters(time.time_ns() % 26 ** 8)}{_letters(concurrency)}"
+            try:
+                if scenario == "analysis":
+                    entry = run_analysis(args.requests, concurrency, run_id, traffic)
+                elif scenario == "batch" and args.replay:
+                    entry = {"error": "bulk classification is not replayed from cassettes"}
+                elif scenario == "batch":
+                    entry = run_batch(args.batch_questions, concurrency, args.batch_size, run_id)
+                else:
+                    entry = run_ocr(args.requests, concurrency, run_id)
+            except Exception as e:
+                # e.g. EasyOCR missing under --real-ocr; the other scenarios still run
+                entry = {"error": f"{type(e).__name__}: {e}"}
+            entry = {"scenario": scenario, "concurrency": concurrency, **entry}
+            results["results"].append(entry)
+            if "error" in entry:
+                print(f"{scenario:<9} c={concurrency:<3} skipped: {entry['error']}", file=sys.stderr)
+            else:
+                print(f"{scenario:<9} c={concurrency:<3} {entry['throughput']:8.2f}/s  "
+                      f"p50 {entry['p50']:.3f}s  p95 {entry['p95']:.3f}s  p99 {entry['p99']:.3f}s  "
+                      f"peak {entry['peak_memory_mb']:.1f} MB  errors {entry['errors']}", file=sys.stderr)
+
+    output = args.output or os.path.join(BENCHMARK_OUTPUT_DIR, f"benchmark-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as handle:
+        json.dump(results, handle, indent=2)
+    print(f"Results saved to {output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as handle:
+            for line in compare(results, json.load(handle)):
+                print(line, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
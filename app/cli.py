@@ -0,0 +1,183 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from typing import Iterator, List, Optional, Tuple
+from app.utils.cassette import install_cassette
+from app.utils.classification import CLASSIFICATION_BATCH_SIZE, classify_stream, local_classification_stats
+
+# Rows in flight at once; new rows are read as earlier batches finish and are written
+CLI_CHUNK_SIZE = int(os.getenv("CLI_CHUNK_SIZE", "1000"))
+
+
+def _question_column(header) -> int:
+    """Use the "question" column when present, otherwise the first column"""
+    names = [str(name).strip().lower() if name is not None else "" for name in header]
+    return names.index("question") if "question" in names else 0
+
+
+def _rows_from_table(rows) -> Iterator[Tuple[int, str]]:
+    header = next(rows, None)
+    if header is None:
+        return
+    column = _question_column(header)
+    # Row numbers match the spreadsheet, with the header on row 1
+    for number, row in enumerate(rows, 2):
+        value = row[column] if column < len(row) else None
+        if value is not None and str(value).strip():
+            yield number, str(value).strip()
+
+
+def read_xlsx(path: str) -> Iterator[Tuple[int, str]]:
+    from openpyxl import load_workbook
+
+    # read_only mode iterates rows lazily instead of loading the whole sheet
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from _rows_from_table(workbook.active.iter_rows(values_only=True))
+    finally:
+        workbook.close()
+
+
+def read_csv(path: str) -> Iterator[Tuple[int, str]]:
+    with open(path, newline="", encoding="utf-8-sig") as handle:
+        yield from _rows_from_table(csv.reader(handle))
+
+
+def read_jsonl(path: str) -> Iterator[Tuple[int, str]]:
+    with open(path, encoding="utf-8") as handle:
+        for number, line in enumerate(handle, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            question = record.get("question") if isinstance(record, dict) else record
+            if question is not None and str(question).strip():
+                yield number, str(question).strip()
+
+
+READERS = {".xlsx": read_xlsx, ".csv": read_csv, ".jsonl": read_jsonl}
+
+
+class CsvWriter:
+    def __init__(self, path: str):
+        self.handle = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.handle)
+        self.writer.writerow(["row", "question", "category"])
+
+    def write(self, records: List[dict]):
+        self.writer.writerows([record["row"], record["question"], record["category"]] for record in records)
+        self.handle.flush()
+
+    def close(self):
+        self.handle.close()
+
+
+class JsonlWriter:
+    def __init__(self, path: str):
+        self.handle = open(path, "w", encoding="utf-8")
+
+    def write(self, records: List[dict]):
+        self.handle.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        self.handle.flush()
+
+    def close(self):
+        self.handle.close()
+
+
+class ParquetWriter:
+    def __init__(self, path: str, row_group_size: int = CLI_CHUNK_SIZE):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = pa.schema([("row", pa.int64()), ("question", pa.string()), ("category", pa.string())])
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.row_group_size = row_group_size
+        self.pending: List[dict] = []
+
+    def write(self, records: List[dict]):
+        # Batches are small; buffer them so row groups stay a useful size
+        self.pending.extend(records)
+        if len(self.pending) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if self.pending:
+            self.writer.write_table(self.pa.Table.from_pylist(self.pending, schema=self.schema))
+            self.pending = []
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+
+WRITERS = {".csv": CsvWriter, ".jsonl": JsonlWriter, ".parquet": ParquetWriter}
+
+
+def classify_file(input_path: str, output_path: str, batch_size: int = CLASSIFICATION_BATCH_SIZE,
+                  chunk_size: int = CLI_CHUNK_SIZE, max_concurrency: Optional[int] = None) -> dict:
+    """Stream questions from input_path, classify them and append results to output_path.
+
+    Results are written as their batches finish, so rows appear in completion order.
+    """
+    reader = READERS[os.path.splitext(input_path)[1].lower()]
+    writer = WRITERS[os.path.splitext(output_path)[1].lower()](output_path)
+    start = time.perf_counter()
+    processed = 0
+    errors = 0
+
+    async def run():
+        nonlocal processed, errors
+        reported = 0
+        async for batch in classify_stream(reader(input_path), batch_size, max_concurrency, chunk_size):
+            writer.write([{"row": number, "question": question, "category": category}
+                          for number, question, category in batch])
+            processed += len(batch)
+            errors += sum(1 for _, _, category in batch if category.startswith("Classification Error"))
+            if processed - reported >= chunk_size:
+                reported = processed
+                elapsed = time.perf_counter() - start
+                print(f"{processed} rows classified ({processed / elapsed:.1f} rows/s)", file=sys.stderr)
+
+    try:
+        # One event loop and one worker pool for the whole file
+        asyncio.run(run())
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "rows": processed,
+        "errors": errors,
+        "seconds": elapsed,
+        "rows_per_second": processed / elapsed if elapsed else 0.0,
+        "local": local_classification_stats()
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify questions from an .xlsx, .csv or .jsonl file.")
+    parser.add_argument("input", help="Input file (.xlsx, .csv or .jsonl)")
+    parser.add_argument("-o", "--output", required=True, help="Output file (.csv, .jsonl or .parquet)")
+    parser.add_argument("--batch-size", type=int, default=CLASSIFICATION_BATCH_SIZE,
+                        help="Questions packed into one LLM request")
+    parser.add_argument("--chunk-size", type=int, default=CLI_CHUNK_SIZE,
+                        help="Rows in flight at once; progress is reported every this many rows")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="Maximum concurrent LLM requests")
+    args = parser.parse_args(argv)
+
+    for path, formats in ((args.input, READERS), (args.output, WRITERS)):
+        if os.path.splitext(path)[1].lower() not in formats:
+            parser.error(f"{path}: unsupported format, expected one of {', '.join(formats)}")
+
+    install_cassette()
+    stats = classify_file(args.input, args.output, args.batch_size, args.chunk_size, args.concurrency)
+    print(json.dumps(stats, indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
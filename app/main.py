@@ -3,89 +3,53 @@ import pandas as pd
 import re
 import asyncio
 from io import BytesIO
-from app.utils.ocr import extract_text_from_image
-from app.utils.cordination import create_question_classifier_crew, create_simple_classifier_crew
-from crewai import Task, Crew, Process
-import time
-
-def stream_response(content_text, chunk_size=20, delay=0.05):
-    """Synchronous generator to yield response in chunks"""
-    for i in range(0, len(content_text), chunk_size):
-        yield content_text[i:i + chunk_size]
-        time.sleep(delay)  # Simulate typing
-
-def display_response(response_text, stream=False):
-    """Display the response from CrewAI"""
-    try:
-        # Clean up the response text
-        content_text = str(response_text)
-        
-        # Try to extract the main content if it's wrapped in extra formatting
-        if "Comprehensive Answer:" in content_text:
-            # Split by the comprehensive answer section
-            parts = content_text.split("Comprehensive Answer:")
-            if len(parts) > 1:
-                content_text = "Comprehensive Answer:" + parts[1]
-        
-        st.markdown("### 📖 Analysis Result")
-        if stream:
-            placeholder = st.empty()
-            displayed_text = ""
-            for chunk in stream_response(content_text):
-                displayed_text += chunk
-                placeholder.success(displayed_text)
-        else:
-            st.success(content_text)
-    except Exception as e:
-        st.error(f"⚠️ Failed to parse and display the response: {e}")
+from app.utils.ocr import extract_text_from_image, ocr_cache, ocr_document
+from app.utils.cordination import create_question_classifier_crew, crew_fans_out
+from app.utils.classification import (
+    CLASSIFICATION_BATCH_SIZE,
+    classify_many,
+    local_classification_stats
+)
+from app.utils.answer_cache import answer_cache
+from app.utils.cache import search_cache
+from app.utils.context_budget import context_budget
+from app.utils.jobs import ClassificationJob
+from app.utils.metrics import metrics as pipeline_metrics, span
+from app.utils.cassette import install_cassette
+from app.utils.llm_router import llm_router
+from app.utils.routing import pipeline_router
+from app.utils.singleflight import analysis_flights
 
-def process_single_question_classification(question: str) -> str:
-    """Process a single question for classification only"""
-    try:
-        # Create the classifier agent
-        classifier_agent = create_simple_classifier_crew()
-        
-        # Create a simple classification task
-        task = Task(
-            description=f"""
-            Classify this question: {question}
-            
-            Categories: Mathematical, Definition, Formulation, Inferential, 
-            Differentiation, Analytical, Statistical, Inference
-            
-            Rules:
-            - When word "define" is used, return "Definition"
-            - When word "theory" is used, return "Definition" 
-            - When word "differentiate" is used, return "Differentiation"
-            - When mathematical calculations/numbers/equations are used, return "Mathematical"
-            
-            Return ONLY the category name.
-            """,
-            expected_output="A single category name",
-            agent=classifier_agent
-        )
-        
-        # Create a crew with the agent and task
-        crew = Crew(
-            agents=[classifier_agent],
-            tasks=[task],
-            verbose=False,  # Set to True for debugging
-            process=Process.sequential
-        )
-        
-        # Execute the crew and get result
-        result = crew.kickoff()
-        
-        # Extract the result text
-        if hasattr(result, 'raw'):
-            return result.raw.strip()
-        elif hasattr(result, 'result'):
-            return result.result.strip()
-        else:
-            return str(result).strip()
-            
-    except Exception as e:
-        return f"Classification Error: {str(e)}"
+install_cassette()
+
+def stream_analysis(crew_instance, question: str) -> dict:
+    """Render the coordinator's answer token by token as the crew produces it"""
+    metrics = {}
+    
+    def tokens():
+        for event in crew_instance.iter_stream(question):
+            if event["type"] == "token":
+                yield event["content"]
+            elif event["type"] == "metrics":
+                metrics.update(event)
+            elif event["type"] == "error":
+                raise RuntimeError(event["error"])
+    
+    st.markdown("### 📖 Analysis Result")
+    metrics["response"] = st.write_stream(tokens())
+    return metrics
+
+def analysis_summary(metrics: dict) -> str:
+    """Format total latency and time to first token for the status message"""
+    summary = f"{metrics.get('total_seconds') or 0:.1f}s"
+    if metrics.get("time_to_first_token") is not None:
+        summary += f", first token after {metrics['time_to_first_token']:.1f}s"
+    trace = metrics.get("trace") or {}
+    if trace.get("prompt_tokens") or trace.get("completion_tokens"):
+        summary += f", {trace['prompt_tokens'] + trace['completion_tokens']} tokens (~${trace['cost_usd']:.4f})"
+    if (trace.get("context_tokens") or {}).get("saved"):
+        summary += f", {trace['context_tokens']['saved']} context tokens trimmed"
+    return summary
 
 # Page Config
 st.set_page_config(page_title="Question Classifier", layout="wide")
@@ -97,6 +61,29 @@ st.sidebar.markdown("---")
 
 upload_image = st.sidebar.file_uploader("📤 Upload an Image", type=["jpg", "jpeg", "png"], key="img_upload")
 upload_excel = st.sidebar.file_uploader("📥 Upload Excel File (.xlsx)", type=["xlsx"], key="xlsx_upload")
+upload_documents = st.sidebar.file_uploader(
+    "📑 Upload Scanned Pages (PDF, TIFF or images)",
+    type=["pdf", "tif", "tiff", "jpg", "jpeg", "png"],
+    accept_multiple_files=True,
+    key="doc_upload"
+)
+
+st.sidebar.markdown("---")
+if crew_fans_out():
+    run_concurrently = st.sidebar.checkbox("⚡ Run classification and searches concurrently", value=True)
+    compare_modes = st.sidebar.checkbox("⏱️ Compare latency with sequential run", value=False)
+else:
+    # Classification and search run before the crew, which is left with the coordinator alone
+    run_concurrently, compare_modes = True, False
+    st.sidebar.caption("⚡ Classification and federated search run before the coordinator, so there is no "
+                       "agent fan-out to run concurrently.")
+batch_size = st.sidebar.number_input(
+    "📦 Questions per classification request",
+    min_value=1,
+    max_value=100,
+    value=CLASSIFICATION_BATCH_SIZE,
+    help="Excel questions are packed into one LLM request per batch; 1 classifies each question separately."
+)
 
 st.title("📚 Question Prism (Question Classifier)")
 
@@ -109,12 +96,23 @@ if st.button("Classify Question"):
     else:
         with st.spinner("Analyzing question..."):
             try:
-                # Create the crew and process the question
-                crew_instance = create_question_classifier_crew()
-                response = crew_instance.run(question_input)
+                # Create the crew and stream the answer as it is generated
+                crew_instance = create_question_classifier_crew(concurrent=run_concurrently)
+                metrics = stream_analysis(crew_instance, question_input)
+                
+                st.success(f"✅ Analysis Complete! ({analysis_summary(metrics)})")
                 
-                st.success("✅ Analysis Complete!")
-                display_response(response, stream=True)
+                if compare_modes:
+                    with st.spinner("Comparing sequential and concurrent execution..."):
+                        timings = crew_instance.compare_execution_modes(question_input)
+                    comparison = (
+                        f"⏱️ Sequential: {timings['sequential'] or 0:.1f}s | "
+                        f"Concurrent: {timings['concurrent'] or 0:.1f}s | "
+                        f"Speedup: {timings.get('speedup', 0):.2f}x"
+                    )
+                    if not timings.get("upstream_tasks"):
+                        comparison += " (this question's crew had only the coordinator task, so there was nothing to overlap)"
+                    st.info(comparison)
                 
             except Exception as e:
                 st.error(f"❌ Error during analysis: {str(e)}")
@@ -134,12 +132,11 @@ if upload_image is not None:
 
                 with st.spinner("Analyzing extracted text..."):
                     try:
-                        # Create the crew and process the extracted text
-                        crew_instance = create_question_classifier_crew()
-                        response = crew_instance.run(extracted_text)
+                        # Create the crew and stream the answer for the extracted text
+                        crew_instance = create_question_classifier_crew(concurrent=run_concurrently)
+                        metrics = stream_analysis(crew_instance, extracted_text)
                         
-                        st.success("✅ Analysis Complete!")
-                        display_response(response, stream=True)
+                        st.success(f"✅ Analysis Complete! ({analysis_summary(metrics)})")
                         
                     except Exception as e:
                         st.error(f"❌ Error during analysis: {str(e)}")
@@ -150,7 +147,8 @@ if upload_excel is not None:
     st.subheader("📊 Excel File Classification Result")
     try:
         contents = upload_excel.read()
-        df = pd.read_excel(BytesIO(contents))
+        with span("excel_parse"):
+            df = pd.read_excel(BytesIO(contents))
 
         # Determine which column contains questions
         if 'question' in df.columns:
@@ -161,28 +159,40 @@ if upload_excel is not None:
         if not questions:
             st.error("❌ No questions found in the Excel file.")
         else:
-            results = []
+            # Rows are checkpointed to disk, so a refresh or restart resumes instead of starting over
+            job = ClassificationJob.for_questions(questions)
+            # The button's click state is there at the top of the rerun it triggers, before the job runs
+            if st.session_state.get(f"retry_{job.job_id}"):
+                st.info(f"🔁 Retrying {job.reset_failed()} failed rows.")
+            pending = len(job.pending_indices())
+            if 0 < pending < len(questions):
+                st.info(f"🔁 Resuming job {job.job_id}: {len(questions) - pending} of {len(questions)} rows already processed.")
+            
             progress_bar = st.progress(0)
             
-            for i, question in enumerate(questions):
-                try:
-                    # Process each question for classification
-                    category = process_single_question_classification(str(question))
-                    results.append({
-                        "Question": question,
-                        "Category": category
-                    })
-                    
-                    # Update progress
-                    progress_bar.progress((i + 1) / len(questions))
-                    
-                except Exception as e:
-                    results.append({
-                        "Question": question,
-                        "Category": f"Error: {str(e)}"
-                    })
-
-            st.success(f"✅ Classified {len(results)} questions successfully!")
+            # Batches are classified concurrently by the adaptive worker pool
+            categories = job.run(
+                batch_size,
+                on_progress=lambda done, total: progress_bar.progress(done / total)
+            )
+            results = [
+                {"Question": question, "Category": category}
+                for question, category in zip(questions, categories)
+            ]
+
+            failed = len(job.failed_indices())
+            if failed:
+                st.warning(f"⚠️ {failed} rows failed; retry them once the provider is back.")
+                st.button("🔁 Retry failed rows", key=f"retry_{job.job_id}")
+            else:
+                st.success(f"✅ Classified {len(results)} questions successfully!")
+            
+            local_stats = local_classification_stats()
+            st.caption(
+                f"⚡ Decided without an LLM call: {local_stats['rules']['short_circuited']} by rules, "
+                f"{local_stats['cache']['hits']} from the cache, "
+                f"{local_stats['knn']['short_circuited']} by the nearest-neighbour classifier"
+            )
             
             results_df = pd.DataFrame(results)
             st.dataframe(results_df)
@@ -199,6 +209,84 @@ if upload_excel is not None:
     except Exception as e:
         st.error(f"❌ Error processing Excel file: {str(e)}")
 
+if upload_documents:
+    st.subheader("📑 Scanned Document Classification Result")
+    page_questions = []
+    page_timings = []
+    
+    # Pages are shown as soon as each one has been through OCR
+    for uploaded in upload_documents:
+        try:
+            for page in ocr_document(uploaded.getvalue()):
+                timings = page["timings"]
+                page_timings.append({
+                    "File": uploaded.name,
+                    "Page": page["page"],
+                    "Preprocess (s)": round(timings["preprocess"], 3),
+                    "OCR (s)": round(timings["ocr"], 3),
+                    "Cached": page.get("cached", False),
+                    "Questions": len(page["questions"])
+                })
+                source = "cached" if page.get("cached") else f"{timings['total']:.2f}s"
+                with st.expander(f"{uploaded.name} — page {page['page']} ({source})"):
+                    st.text(page["text"] or "No text detected.")
+                page_questions += [
+                    {"File": uploaded.name, "Page": page["page"], "Question": question}
+                    for question in page["questions"]
+                ]
+        except Exception as e:
+            st.error(f"❌ Error processing {uploaded.name}: {str(e)}")
+    
+    st.dataframe(pd.DataFrame(page_timings))
+    
+    if not page_questions:
+        st.error("❌ No text detected in the uploaded documents.")
+    else:
+        with st.spinner("Classifying extracted questions..."):
+            categories = classify_many([row["Question"] for row in page_questions], batch_size)
+        for row, category in zip(page_questions, categories):
+            row["Category"] = category
+        
+        st.success(f"✅ Classified {len(page_questions)} questions from {len(page_timings)} pages!")
+        document_df = pd.DataFrame(page_questions)
+        st.dataframe(document_df)
+        st.download_button(
+            label="📥 Download Results as CSV",
+            data=document_df.to_csv(index=False),
+            file_name="document_classifications.csv",
+            mime="text/csv",
+            key="document_download"
+        )
+
+with st.sidebar.expander("⏱️ Stage latency"):
+    st.dataframe(pd.DataFrame([
+        {"stage": series["labels"].get("stage"), **{key: series[key] for key in ("count", "p50", "p95", "p99")}}
+        for series in pipeline_metrics.snapshot()["histograms"].get("stage_duration_seconds", [])
+    ]))
+
+with st.sidebar.expander("🧭 Pipeline routing"):
+    routing_report = pipeline_router.report()
+    if routing_report:
+        st.dataframe(pd.DataFrame([
+            {"category": category, **entry, "plan": ", ".join(entry["plan"]) or "no search"}
+            for category, entry in routing_report.items()
+        ]))
+    else:
+        st.caption("No analyses yet.")
+
+with st.sidebar.expander("🔀 LLM providers"):
+    st.json(llm_router.stats())
+
+with st.sidebar.expander("📈 Cache statistics"):
+    st.json({
+        "classification": local_classification_stats(),
+        "answers": answer_cache.stats(),
+        "coalesced_analyses": analysis_flights.stats(),
+        "search": search_cache.stats(),
+        "ocr": ocr_cache.stats(),
+        "coordinator_context": context_budget.stats()
+    })
+
 # Add some helpful information
 st.markdown("---")
 st.markdown("### 📋 Classification Categories")
@@ -217,6 +305,7 @@ st.markdown("### 🔧 Features")
 st.markdown("""
 - **Text Input**: Type your question directly
 - **Image Upload**: Extract text from images using OCR
+- **Scanned Documents**: OCR multi-page PDFs and TIFFs page by page and classify each question
 - **Excel Processing**: Batch classify questions from Excel files
 - **Web Search**: Get comprehensive answers using DuckDuckGo and Tavily
 - **Real-time Results**: Stream responses for better user experience
@@ -1,47 +1,136 @@
-from crewai import Agent, Task, Crew, Process
+from crewai import Agent, Task, Crew, Process, LLM
 from langchain_openai import ChatOpenAI
 from langchain_groq import ChatGroq
 from app.utils.tools import duckduckgo_tool, tavily_tool
-from app.utils.prompts import get_classification_prompt, get_duckduckgo_prompt, get_tavily_prompt
+from app.utils.event_log import CREW_VERBOSE
+from app.utils.llm_router import HedgedLLM, llm_router
+from app.utils.fewshot import dynamic_prompt_enabled
+from app.utils.prompts import (
+    get_classification_prompt,
+    get_compact_classification_prompt,
+    get_duckduckgo_prompt,
+    get_tavily_prompt
+)
+from app.utils.registry import registry, shared_http_client
+from app.utils.streaming import attach_stream_handler
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 
+OPENAI_MODEL = "gpt-4o"
+GROQ_MODEL = "llama-3.3-70b-versatile"
+DEFAULT_MODELS = {"openai": OPENAI_MODEL, "groq": GROQ_MODEL}
+
 class LLMManager:
     """Manages LLM instances for different agents"""
     
     def __init__(self):
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         self.groq_api_key = os.getenv("GROQ_API_KEY")
+        # Optional (provider, model) -> LLM hook that replaces the real clients, e.g. in benchmarks
+        self.llm_factory = None
         
     def get_openai_llm(self, streaming_callback=None):
         """Get OpenAI LLM instance"""
+        if self.llm_factory is not None:
+            return self.llm_factory("openai", OPENAI_MODEL)
+        # Callback-free clients are shared; streaming clients stay per request
+        if streaming_callback is None:
+            return registry.get_or_create(("llm", "openai", OPENAI_MODEL), self._build_openai_llm)
+        return self._build_openai_llm(streaming_callback)
+    
+    def get_groq_llm(self, streaming_callback=None):
+        """Get Groq LLM instance"""
+        if self.llm_factory is not None:
+            return self.llm_factory("groq", GROQ_MODEL)
+        if streaming_callback is None:
+            return registry.get_or_create(("llm", "groq", GROQ_MODEL), self._build_groq_llm)
+        return self._build_groq_llm(streaming_callback)
+    
+    def get_provider_llm(self, provider: str, model: str):
+        """Get a CrewAI LLM for one provider and model, as used behind the provider router"""
+        if self.llm_factory is not None:
+            return self.llm_factory(provider, model)
+        shared_http_client()
+        if provider == "groq":
+            return LLM(model=f"groq/{model}", api_key=self.groq_api_key, temperature=0.1)
+        return LLM(model=model, api_key=self.openai_api_key, temperature=0.1)
+    
+    def available_providers(self) -> set:
+        """Providers with an API key, or every provider when a factory replaces the clients"""
+        if self.llm_factory is not None:
+            return set(DEFAULT_MODELS)
+        keys = {"openai": self.openai_api_key, "groq": self.groq_api_key}
+        return {provider for provider, key in keys.items() if key}
+    
+    def agent_models(self, agent: str) -> list:
+        """The provider:model pairs get_agent_llm may send an agent's calls to, for keying caches of its answers"""
+        available = self.available_providers() if llm_router.enabled else set()
+        models = [
+            f"{provider}:{model or DEFAULT_MODELS[provider]}"
+            for provider, model in llm_router.candidates(agent)
+            if provider in available
+        ]
+        return models or [f"openai:{OPENAI_MODEL}"]
+    
+    def get_agent_llm(self, agent: str, streaming_callback=None):
+        """Get the LLM for an agent: its preferred providers behind hedging and failover, or OpenAI"""
+        if not llm_router.enabled:
+            return self.get_openai_llm(streaming_callback)
+        available = self.available_providers()
+        candidates = {
+            provider: self.get_provider_llm(provider, model or DEFAULT_MODELS[provider])
+            for provider, model in llm_router.candidates(agent)
+            if provider in available
+        }
+        if not candidates:
+            return self.get_openai_llm(streaming_callback)
+        return HedgedLLM(agent, candidates)
+    
+    def _build_openai_llm(self, streaming_callback=None):
         return ChatOpenAI(
-            model="gpt-4o",
+            model=OPENAI_MODEL,
             api_key=self.openai_api_key,
             streaming=streaming_callback is not None,
             callbacks=[streaming_callback] if streaming_callback else None,
-            temperature=0.1
+            temperature=0.1,
+            http_client=shared_http_client()
         )
     
-    def get_groq_llm(self, streaming_callback=None):
-        """Get Groq LLM instance"""
+    def _build_groq_llm(self, streaming_callback=None):
         return ChatGroq(
-            model="llama-3.3-70b-versatile",
+            model=GROQ_MODEL,
             api_key=self.groq_api_key,
             streaming=streaming_callback is not None,
             callbacks=[streaming_callback] if streaming_callback else None,
-            temperature=0.1
+            temperature=0.1,
+            http_client=shared_http_client()
         )
 
 llm_manager = LLMManager()
 
-def create_classifier_agent(streaming_callback=None):
+def _build_classifier_agent(streaming_callback=None):
     """Create a classifier agent for categorizing questions"""
     
     # Get LLM instance
-    llm = llm_manager.get_openai_llm(streaming_callback)
+    llm = llm_manager.get_agent_llm("classifier", streaming_callback)
+    
+    if dynamic_prompt_enabled():
+        # Categories and rules come from the goal and the task, and each task carries
+        # only the examples nearest to its questions
+        return Agent(
+            role="Question Classifier",
+            goal=get_compact_classification_prompt(),
+            backstory="""
+        You are an expert question classifier with deep knowledge of educational taxonomy.
+        Be precise and follow the classification guidelines strictly.
+        """,
+            verbose=CREW_VERBOSE,
+            llm=llm,
+            max_iter=1,
+            allow_delegation=False
+        )
     
     return Agent(
         role="Question Classifier",
@@ -68,17 +157,17 @@ def create_classifier_agent(streaming_callback=None):
         - When mathematical calculations, numbers, or equations are involved, classify as "Mathematical"
         - Be precise and follow the classification guidelines strictly
         """,
-        verbose=True,
+        verbose=CREW_VERBOSE,
         llm=llm,
         max_iter=1,
         allow_delegation=False
     )
 
-def create_duckduckgo_agent(streaming_callback=None):
+def _build_duckduckgo_agent(streaming_callback=None):
     """Create a DuckDuckGo search agent"""
     
     # Get LLM instance
-    llm = llm_manager.get_openai_llm(streaming_callback)
+    llm = llm_manager.get_agent_llm("duckduckgo", streaming_callback)
     
     return Agent(
         role="DuckDuckGo Search Specialist",
@@ -99,16 +188,16 @@ def create_duckduckgo_agent(streaming_callback=None):
         Always cite your sources and provide links when available.
         """,
         tools=[duckduckgo_tool],
-        verbose=True,
+        verbose=CREW_VERBOSE,
         llm=llm,
         allow_delegation=False
     )
 
-def create_tavily_agent(streaming_callback=None):
+def _build_tavily_agent(streaming_callback=None):
     """Create a Tavily search agent"""
     
     # Get LLM instance  
-    llm = llm_manager.get_openai_llm(streaming_callback)
+    llm = llm_manager.get_agent_llm("tavily", streaming_callback)
     
     return Agent(
         role="Tavily Search Specialist", 
@@ -129,16 +218,16 @@ def create_tavily_agent(streaming_callback=None):
         provide proper attribution to sources.
         """,
         tools=[tavily_tool],
-        verbose=True,
+        verbose=CREW_VERBOSE,
         llm=llm,
         allow_delegation=False
     )
 
-def create_coordinator_agent(streaming_callback=None):
+def _build_coordinator_agent(streaming_callback=None):
     """Create a coordinator agent to orchestrate the workflow"""
     
     # Get LLM instance
-    llm = llm_manager.get_openai_llm(streaming_callback)
+    llm = llm_manager.get_agent_llm("coordinator", streaming_callback)
     
     return Agent(
         role="Coordinator",
@@ -158,7 +247,32 @@ def create_coordinator_agent(streaming_callback=None):
         You excel at combining different types of information and perspectives to create
         well-rounded, informative responses that fully satisfy user needs.
         """,
-        verbose=True,
+        verbose=CREW_VERBOSE,
         llm=llm,
         allow_delegation=True
-    )
\ No newline at end of file
+    )
+
+def _agent_from_template(name, build, streaming_callback=None):
+    """Copy a process-wide agent template, or build a fresh agent when streaming to a callback"""
+    if streaming_callback is not None:
+        agent = build(streaming_callback)
+        attach_stream_handler(agent.llm, streaming_callback)
+        return agent
+    # Each request gets its own copy so executor and tool-cache state stay isolated
+    return registry.get_or_create(("agent", name), build).copy()
+
+def create_classifier_agent(streaming_callback=None):
+    """Create a classifier agent for categorizing questions"""
+    return _agent_from_template("classifier", _build_classifier_agent, streaming_callback)
+
+def create_duckduckgo_agent(streaming_callback=None):
+    """Create a DuckDuckGo search agent"""
+    return _agent_from_template("duckduckgo", _build_duckduckgo_agent, streaming_callback)
+
+def create_tavily_agent(streaming_callback=None):
+    """Create a Tavily search agent"""
+    return _agent_from_template("tavily", _build_tavily_agent, streaming_callback)
+
+def create_coordinator_agent(streaming_callback=None):
+    """Create a coordinator agent to orchestrate the workflow"""
+    return _agent_from_template("coordinator", _build_coordinator_agent, streaming_callback)
\ No newline at end of file
@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from app.utils.agents import llm_manager
+from app.utils.cache import SQLiteCache, fingerprint
+from app.utils.embeddings import HashedTfidfVectorizer, TOKEN_PATTERN, normalize_text
+from app.utils.federated import FEDERATED_SEARCH
+from app.utils.metrics import metrics
+from app.utils.prompts import get_classification_examples
+from app.utils.routing import PIPELINE_PLANS
+
+# Serve completed analyses again for rephrasings of a question already answered
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "true").lower() in ("1", "true", "yes")
+# Cosine similarity a stored question needs, and the share of content words (Jaccard) the two must have in common
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.8"))
+SEMANTIC_CACHE_MIN_OVERLAP = float(os.getenv("SEMANTIC_CACHE_MIN_OVERLAP", "0.75"))
+# Answers draw on web search, so they go stale
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "86400"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", "logs/answer_cache.sqlite3")
+# Hashed feature dimensions; the index holds SEMANTIC_CACHE_MAX_ENTRIES rows of this many float32s
+SEMANTIC_CACHE_FEATURES = 2 ** 11
+
+# Openers that only say "tell me what X is", so "what is oscillation?" and "define oscillation" meet
+QUESTION_OPENER = re.compile(
+    r"^(?:(?:can|could) you |please )?"
+    r"(?:what (?:is|are|was|were) (?:meant by |the meaning of )?|what's |what do you (?:mean|understand) by |"
+    r"define |definition of |meaning of |explain |describe |tell me about |give (?:a|the) definition of )"
+    r"(?:the |an? )?"
+)
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "for", "to", "and", "or", "is", "are", "was", "were", "be", "it", "its",
+    "what", "how", "why", "which", "does", "do", "with", "by", "about", "this", "that", "these", "those",
+    "from", "as", "at", "into", "can", "you", "please", "me"
+}
+# Words that ask for an explanation rather than name the topic, as in "what does oscillation mean"
+FILLER_WORDS = {
+    "mean", "meaning", "meant", "concept", "definition", "define", "explain", "explanation", "describe", "understand"
+}
+NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+
+
+def canonical_question(question: str) -> str:
+    """Lowercase, trim punctuation and drop definitional openers"""
+    text = normalize_text(question).rstrip("?.!: ")
+    return QUESTION_OPENER.sub("", text)
+
+
+def content_words(text: str) -> frozenset:
+    """Topic words: stopwords and filler dropped, plural endings removed"""
+    words = set()
+    for word in TOKEN_PATTERN.findall(text):
+        if word in STOPWORDS or word in FILLER_WORDS:
+            continue
+        if len(word) > 4 and word.endswith("es") and not word.endswith("ses"):
+            word = word[:-2]
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.add(word)
+    return frozenset(words)
+
+
+def embedding_text(words: frozenset) -> str:
+    # Questions are embedded by their topic words, so phrasing alone does not lower the similarity
+    return " ".join(sorted(words))
+
+
+def word_overlap(first: frozenset, second: frozenset) -> float:
+    """Jaccard overlap of two content word sets"""
+    union = first | second
+    return len(first & second) / len(union) if union else 1.0
+
+
+class SemanticAnswerCache:
+    """Completed analyses indexed by question embedding, for rephrasings of answered questions.
+
+    Lookups are one matrix-vector product over a preallocated float32 matrix. A
+    stored question matches when it is similar enough, shares enough of its content
+    words, has exactly the same numbers, and its category does not contradict the
+    local classifier. Entries
+    expire after a TTL, the least recently used one is replaced when the index is
+    full, and everything is persisted in SQLite for the next process.
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, ttl_seconds: float = SEMANTIC_CACHE_TTL_SECONDS,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES, path: Optional[str] = SEMANTIC_CACHE_PATH,
+                 enabled: bool = SEMANTIC_CACHE, min_overlap: float = SEMANTIC_CACHE_MIN_OVERLAP):
+        self.threshold = threshold
+        self.min_overlap = min_overlap
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        # Stored answers depend on the coordinator's models and on which searches fed them
+        self.fingerprint = fingerprint(*llm_manager.agent_models("coordinator"),
+                                       json.dumps(PIPELINE_PLANS, sort_keys=True), str(FEDERATED_SEARCH))
+        self.disk = SQLiteCache(path, max_entries, ttl_seconds) if path else None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._vectorizer: Optional[HashedTfidfVectorizer] = None
+        self._matrix: Optional[np.ndarray] = None
+        self._created: Optional[np.ndarray] = None
+        self._last_used: Optional[np.ndarray] = None
+        self._entries: List[dict] = []
+        self._slots: Dict[str, int] = {}
+
+    def _ensure_index(self):
+        # Built lazily: the IDF comes from the example bank, and the persisted entries are re-embedded
+        if self._vectorizer is not None:
+            return
+        examples = [
+            embedding_text(content_words(canonical_question(text)))
+            for texts in get_classification_examples().values() for text in texts
+        ]
+        self._vectorizer = HashedTfidfVectorizer(SEMANTIC_CACHE_FEATURES).fit(examples)
+        self._matrix = np.zeros((self.max_entries, SEMANTIC_CACHE_FEATURES), dtype=np.float32)
+        self._created = np.zeros(self.max_entries)
+        self._last_used = np.zeros(self.max_entries)
+        if self.disk is not None:
+            for _, value, created in reversed(self.disk.items(self.max_entries, f"{self.fingerprint}:")):
+                entry = json.loads(value)
+                self._insert(entry["question"], entry["answer"], entry.get("category"), created)
+
+    def _key(self, question: str) -> str:
+        return f"{self.fingerprint}:{hashlib.sha256(normalize_text(question).encode('utf-8')).hexdigest()}"
+
+    def _insert(self, question: str, answer: str, category: Optional[str], created: float):
+        canonical = canonical_question(question)
+        words = content_words(canonical)
+        slot = self._slots.get(normalize_text(question))
+        if slot is None:
+            if len(self._entries) < self.max_entries:
+                slot = len(self._entries)
+                self._entries.append({})
+            else:
+                # Full: replace the least recently used entry
+                slot = int(np.argmin(self._last_used[:len(self._entries)]))
+                del self._slots[normalize_text(self._entries[slot]["question"])]
+                self.evictions += 1
+        self._slots[normalize_text(question)] = slot
+        self._entries[slot] = {
+            "question": question,
+            "answer": answer,
+            "category": category,
+            "words": words,
+            "numbers": NUMBER_PATTERN.findall(canonical)
+        }
+        self._matrix[slot] = self._vectorizer.embed(embedding_text(words))
+        self._created[slot] = created
+        self._last_used[slot] = time.time()
+
+    def _remove(self, slot: int):
+        # Keep live rows contiguous by moving the last one into the freed slot
+        last = len(self._entries) - 1
+        del self._slots[normalize_text(self._entries[slot]["question"])]
+        if slot != last:
+            self._entries[slot] = self._entries[last]
+            self._slots[normalize_text(self._entries[slot]["question"])] = slot
+            for array in (self._matrix, self._created, self._last_used):
+                array[slot] = array[last]
+        self._entries.pop()
+
+    def _expire(self, now: float):
+        expired = np.nonzero(now - self._created[:len(self._entries)] > self.ttl_seconds)[0]
+        for slot in expired[::-1]:
+            self._remove(int(slot))
+
+    def get(self, question: str, category: Optional[str] = None) -> Optional[Tuple[str, dict]]:
+        """Return a stored answer and its match details for a near-duplicate question, or None"""
+        if not self.enabled:
+            return None
+        canonical = canonical_question(question)
+        words = content_words(canonical)
+        numbers = NUMBER_PATTERN.findall(canonical)
+        now = time.time()
+        entry, similarity = None, 0.0
+        with self._lock:
+            self._ensure_index()
+            self._expire(now)
+            similarities = self._matrix[:len(self._entries)] @ self._vectorizer.embed(embedding_text(words))
+            for slot in np.argsort(-similarities):
+                if similarities[slot] < self.threshold:
+                    break
+                candidate = self._entries[slot]
+                # Different numbers always mean a different question; wording only has to be close
+                if candidate["numbers"] != numbers or word_overlap(candidate["words"], words) < self.min_overlap:
+                    continue
+                if category and candidate["category"] and category != candidate["category"]:
+                    continue
+                entry, similarity = candidate, float(similarities[slot])
+                self._last_used[slot] = now
+                break
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.inc("answer_cache_lookups_total", outcome="miss" if entry is None else "hit")
+        if entry is None:
+            return None
+        return entry["answer"], {"matched_question": entry["question"], "similarity": round(similarity, 4),
+                                 "category": entry["category"]}
+
+    def set(self, question: str, answer: str, category: Optional[str] = None):
+        """Store a completed analysis"""
+        if not self.enabled or not answer.strip():
+            return
+        with self._lock:
+            self._ensure_index()
+            self._insert(question, answer, category, time.time())
+        if self.disk is not None:
+            self.disk.set(self._key(question),
+                          json.dumps({"question": question, "answer": answer, "category": category}))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "size": len(self._entries)
+            }
+
+
+answer_cache = SemanticAnswerCache()
@@ -0,0 +1,148 @@
+import asyncio
+import contextvars
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, AsyncIterator, Callable, Iterable, List, Optional, Sequence, Tuple
+from asyncio_throttle import Throttler
+
+BULK_INITIAL_CONCURRENCY = int(os.getenv("BULK_INITIAL_CONCURRENCY", "4"))
+BULK_MAX_CONCURRENCY = int(os.getenv("BULK_MAX_CONCURRENCY", "16"))
+BULK_MAX_REQUESTS_PER_SECOND = float(os.getenv("BULK_MAX_REQUESTS_PER_SECOND", "10"))
+BULK_MAX_RETRIES = int(os.getenv("BULK_MAX_RETRIES", "4"))
+
+
+def is_overload_error(error: Exception) -> bool:
+    """True for provider rate limits (429) and timeouts, which call for backing off"""
+    name = type(error).__name__.lower()
+    message = str(error).lower()
+    return (
+        "ratelimit" in name
+        or "timeout" in name
+        or "429" in message
+        or "rate limit" in message
+        or "timed out" in message
+    )
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD limit on in-flight calls: halve on overload, grow by one after a window of successes"""
+
+    def __init__(self, initial: int = BULK_INITIAL_CONCURRENCY, minimum: int = 1,
+                 maximum: int = BULK_MAX_CONCURRENCY):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = min(max(initial, minimum), self.maximum)
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self, overloaded: bool = False):
+        async with self._condition:
+            self.in_flight -= 1
+            if overloaded:
+                self.limit = max(self.minimum, self.limit // 2)
+                self._successes = 0
+            else:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.maximum:
+                    self.limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+
+class BulkEngine:
+    """Async worker pool that runs a blocking function over many items in input order"""
+
+    def __init__(self, worker: Callable[[Any], Any],
+                 initial_concurrency: int = BULK_INITIAL_CONCURRENCY,
+                 max_concurrency: int = BULK_MAX_CONCURRENCY,
+                 max_requests_per_second: float = BULK_MAX_REQUESTS_PER_SECOND,
+                 max_retries: int = BULK_MAX_RETRIES,
+                 on_error: Optional[Callable[[Any, Exception], Any]] = None):
+        self.worker = worker
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_requests_per_second = max_requests_per_second
+        self.max_retries = max_retries
+        self.on_error = on_error or (lambda item, error: error)
+        self.overloads = 0
+        self.peak_concurrency = 0
+
+    async def _process(self, item, limiter, throttler, executor):
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire()
+            self.peak_concurrency = max(self.peak_concurrency, limiter.in_flight)
+            overloaded = False
+            try:
+                async with throttler:
+                    pass
+                # Copy the context so request traces follow the work onto the pool thread
+                context = contextvars.copy_context()
+                return await loop.run_in_executor(executor, context.run, self.worker, item)
+            except Exception as e:
+                overloaded = is_overload_error(e)
+                if not overloaded or attempt == self.max_retries:
+                    return self.on_error(item, e)
+                self.overloads += 1
+            finally:
+                await limiter.release(overloaded)
+            # Exponential backoff with jitter before retrying an overloaded call
+            await asyncio.sleep(min(30.0, 2 ** attempt) * (0.5 + random.random()))
+
+    async def run(self, items: Sequence, on_progress: Optional[Callable[[int, int], None]] = None) -> List:
+        """Process all items and return their results in input order"""
+        limiter = AdaptiveConcurrencyLimiter(self.initial_concurrency, maximum=self.max_concurrency)
+        throttler = Throttler(rate_limit=max(1, int(self.max_requests_per_second)), period=1.0)
+        results = [None] * len(items)
+        completed = 0
+
+        async def process_at(index):
+            nonlocal completed
+            results[index] = await self._process(items[index], limiter, throttler, executor)
+            completed += 1
+            if on_progress:
+                on_progress(completed, len(items))
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            await asyncio.gather(*(process_at(i) for i in range(len(items))))
+        return results
+
+    async def stream(self, items: Iterable, window: Optional[int] = None) -> AsyncIterator[Tuple[int, Any]]:
+        """Process items read lazily, yielding (position, result) in completion order.
+
+        At most window items are in progress at once, so an unbounded input keeps
+        memory flat while one limiter, throttler and thread pool serve all of it.
+        """
+        window = max(1, window or 2 * self.max_concurrency)
+        limiter = AdaptiveConcurrencyLimiter(self.initial_concurrency, maximum=self.max_concurrency)
+        throttler = Throttler(rate_limit=max(1, int(self.max_requests_per_second)), period=1.0)
+        pending = enumerate(items)
+
+        async def process_at(index, item):
+            return index, await self._process(item, limiter, throttler, executor)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            running = {asyncio.ensure_future(process_at(index, item)) for index, item in islice(pending, window)}
+            try:
+                while running:
+                    done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    # Top the window up before handing results back, so workers never sit idle
+                    running |= {asyncio.ensure_future(process_at(index, item))
+                                for index, item in islice(pending, len(done))}
+                    for task in done:
+                        yield task.result()
+            finally:
+                for task in running:
+                    task.cancel()
+
+    def run_sync(self, items: Sequence, on_progress: Optional[Callable[[int, int], None]] = None) -> List:
+        """Blocking wrapper around run for synchronous callers"""
+        return asyncio.run(self.run(items, on_progress))
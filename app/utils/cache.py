@@ -0,0 +1,313 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple, Union
+from app.utils.embeddings import normalize_text
+
+CLASSIFICATION_CACHE_PATH = os.getenv("CLASSIFICATION_CACHE_PATH", "logs/classification_cache.sqlite3")
+CLASSIFICATION_CACHE_MAX_ENTRIES = int(os.getenv("CLASSIFICATION_CACHE_MAX_ENTRIES", "100000"))
+
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "3600"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1000"))
+SEARCH_CACHE_MAX_BYTES = int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", "logs/search_cache.sqlite3")
+SEARCH_CACHE_DISK_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_DISK_MAX_ENTRIES", "20000"))
+
+OCR_CACHE_MAX_ENTRIES = int(os.getenv("OCR_CACHE_MAX_ENTRIES", "500"))
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", "logs/ocr_cache.sqlite3")
+OCR_CACHE_DISK_MAX_ENTRIES = int(os.getenv("OCR_CACHE_DISK_MAX_ENTRIES", "20000"))
+
+
+class TTLCache:
+    """In-memory LRU cache bounded by entry count and total value size, with optional expiry"""
+
+    def __init__(self, max_entries: int, max_bytes: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and self.ttl_seconds is not None and time.monotonic() - entry[1] > self.ttl_seconds:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, size: Optional[int] = None):
+        size = len(value) if size is None and isinstance(value, (str, bytes)) else (size or 0)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic(), size)
+            self.size_bytes += size
+            while self._entries and (
+                len(self._entries) > self.max_entries
+                or (self.max_bytes is not None and self.size_bytes > self.max_bytes)
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self.size_bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "size_bytes": self.size_bytes
+            }
+
+
+class SQLiteCache:
+    """Size-bounded LRU key/value store persisted in SQLite"""
+
+    def __init__(self, path: str, max_entries: int, ttl_seconds: Optional[float] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # Opened lazily so the database file is only created once the cache is used
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            # WAL lets the UI and other processes share the file on the mounted volume
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+            self._connection = connection
+        return self._connection
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+            if row and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            connection.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            overflow = connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                # Evict the least recently used entries
+                connection.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                    (overflow,)
+                )
+                self.evictions += overflow
+
+    def items(self, limit: int, prefix: str = "") -> List[Tuple[str, str, float]]:
+        """Live (key, value, created) rows under a key prefix, most recently used first"""
+        cutoff = time.time() - self.ttl_seconds if self.ttl_seconds is not None else 0.0
+        with self._lock:
+            return self._connect().execute(
+                "SELECT key, value, created FROM cache WHERE substr(key, 1, ?) = ? AND created >= ? "
+                "ORDER BY accessed DESC LIMIT ?",
+                (len(prefix), prefix, cutoff, limit)
+            ).fetchall()
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM cache")
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "size": size
+            }
+
+
+class ClassificationCache:
+    """Caches categories by normalised question text and a fingerprint of the prompt and model"""
+
+    def __init__(self, fingerprint: str, path: str = CLASSIFICATION_CACHE_PATH,
+                 max_entries: int = CLASSIFICATION_CACHE_MAX_ENTRIES):
+        self.fingerprint = fingerprint
+        self.store = SQLiteCache(path, max_entries)
+
+    def _key(self, question: str) -> str:
+        return hashlib.sha256(f"{self.fingerprint}\0{normalize_text(question)}".encode("utf-8")).hexdigest()
+
+    def get(self, question: str) -> Optional[str]:
+        return self.store.get(self._key(question))
+
+    def set(self, question: str, category: str):
+        self.store.set(self._key(question), category)
+
+    def stats(self) -> dict:
+        return self.store.stats()
+
+
+class SearchCache:
+    """Two-tier (memory, then SQLite) TTL cache of formatted search results per provider"""
+
+    def __init__(self, ttl_seconds: float = SEARCH_CACHE_TTL_SECONDS,
+                 max_entries: int = SEARCH_CACHE_MAX_ENTRIES,
+                 max_bytes: int = SEARCH_CACHE_MAX_BYTES,
+                 path: Optional[str] = SEARCH_CACHE_PATH,
+                 disk_max_entries: int = SEARCH_CACHE_DISK_MAX_ENTRIES):
+        self.memory = TTLCache(max_entries, max_bytes, ttl_seconds)
+        self.disk = SQLiteCache(path, disk_max_entries, ttl_seconds) if path else None
+        self._lock = threading.Lock()
+        self.by_provider = {}
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Ignore case, punctuation and spacing so near-identical queries share an entry"""
+        return " ".join(re.sub(r"[^\w\s]", " ", str(query).lower()).split())
+
+    def _key(self, provider: str, query: str) -> str:
+        return f"{provider}:{self.normalize_query(query)}"
+
+    def _record(self, provider: str, hit: bool):
+        with self._lock:
+            counters = self.by_provider.setdefault(provider, {"hits": 0, "misses": 0})
+            counters["hits" if hit else "misses"] += 1
+
+    def get(self, provider: str, query: str) -> Optional[str]:
+        key = self._key(provider, query)
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        self._record(provider, value is not None)
+        return value
+
+    def set(self, provider: str, query: str, value: str):
+        key = self._key(provider, query)
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def stats(self) -> dict:
+        with self._lock:
+            providers = {
+                provider: dict(counters, hit_rate=counters["hits"] / (counters["hits"] + counters["misses"]))
+                for provider, counters in self.by_provider.items()
+            }
+        return {
+            "providers": providers,
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None
+        }
+
+
+class OCRCache:
+    """Content-addressed cache of OCR results keyed by image bytes and OCR settings"""
+
+    def __init__(self, settings: str, max_entries: int = OCR_CACHE_MAX_ENTRIES,
+                 max_bytes: int = OCR_CACHE_MAX_BYTES, path: Optional[str] = OCR_CACHE_PATH,
+                 disk_max_entries: int = OCR_CACHE_DISK_MAX_ENTRIES):
+        self.settings = settings
+        self.memory = TTLCache(max_entries, max_bytes)
+        self.disk = SQLiteCache(path, disk_max_entries) if path else None
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        """Content hash of a file; pass it instead of the bytes to hash a document only once"""
+        return hashlib.sha256(data).hexdigest()
+
+    def _key(self, data: Union[bytes, str], page: Union[int, str, None], preprocess: bool) -> str:
+        digest = data if isinstance(data, str) else self.digest(data)
+        return f"{self.settings}:{int(preprocess)}:{page or 0}:{digest}"
+
+    def get(self, data: Union[bytes, str], page: Union[int, str, None] = None,
+            preprocess: bool = True) -> Optional[dict]:
+        key = self._key(data, page, preprocess)
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return json.loads(value) if value is not None else None
+
+    def set(self, data: Union[bytes, str], result: dict, page: Union[int, str, None] = None,
+            preprocess: bool = True):
+        key = self._key(data, page, preprocess)
+        value = json.dumps(result)
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def get_page_count(self, digest: str) -> Optional[int]:
+        """Pages of a document OCR'd before, so its cached pages can be served without opening it"""
+        entry = self.get(digest, "pages")
+        return entry["pages"] if entry is not None else None
+
+    def set_page_count(self, digest: str, pages: int):
+        self.set(digest, {"pages": pages}, "pages")
+
+    def stats(self) -> dict:
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None
+        }
+
+
+def fingerprint(*parts: str) -> str:
+    """Stable hash of prompt text and model names, so editing either invalidates old entries"""
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+search_cache = SearchCache()
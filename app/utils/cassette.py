@@ -0,0 +1,191 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from crewai import LLM
+from app.utils import classification, tools
+from app.utils.agents import llm_manager
+from app.utils.registry import registry, shared_http_client
+from app.utils.stubs import CannedLLM
+
+# "record" captures provider traffic, "replay" serves it back offline, "off" leaves providers alone
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off").lower()
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", "logs/cassettes/session.jsonl.gz")
+# 1.0 replays with the recorded timings, 0.5 twice as fast, 0 without any delay
+CASSETTE_TIME_SCALE = float(os.getenv("CASSETTE_TIME_SCALE", "1.0"))
+
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode for a request the cassette has no recording of"""
+
+
+def request_key(*parts) -> str:
+    """Stable key for a request; responses are matched on it rather than stored prompts"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:32]
+
+
+def _llm_key(model: str, messages: Union[str, List[Dict[str, str]]]) -> str:
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    return request_key("llm", model, [[message.get("role"), message.get("content")] for message in messages])
+
+
+class Cassette:
+    """Append-only gzipped JSON-lines store of LLM, search and local classification results.
+
+    Only a hash of each request is stored next to its response, which keeps
+    cassettes compact. Identical requests are replayed in recorded order, and the
+    last recording is reused once they run out so replays can loop for load tests.
+    Local classification is recorded too, since whether the classification cache
+    answers a question changes which prompts the crew sends afterwards.
+    """
+
+    def __init__(self, path: str = CASSETTE_PATH, mode: str = "record", time_scale: float = CASSETTE_TIME_SCALE):
+        self.path = path
+        self.mode = mode
+        self.time_scale = time_scale
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[dict]] = defaultdict(list)
+        self._positions: Dict[str, int] = defaultdict(int)
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+
+    def load(self) -> "Cassette":
+        with gzip.open(self.path, "rt", encoding="utf-8") as handle:
+            for line in handle:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries[entry["key"]].append(entry)
+        return self
+
+    def record(self, entry: dict):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # Each append is its own gzip member, so a crash loses at most the last entry
+            with gzip.open(self.path, "at", encoding="utf-8") as handle:
+                handle.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.recorded += 1
+
+    def replay(self, key: str) -> dict:
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.misses += 1
+                raise CassetteMiss(f"No recording for request {key} in {self.path}")
+            position = self._positions[key]
+            self._positions[key] = position + 1
+            self.replayed += 1
+            return entries[min(position, len(entries) - 1)]
+
+    def delay(self, entry: dict) -> float:
+        return entry.get("seconds", 0.0) * self.time_scale
+
+    def intercept(self, kind: str, compute: Callable[[], Any], *parts) -> Any:
+        """Record compute()'s result under kind and parts, or serve the recorded one in replay mode"""
+        key = request_key(kind, *parts)
+        if self.mode == "replay":
+            entry = self.replay(key)
+            time.sleep(self.delay(entry))
+            return entry["result"]
+
+        start = time.perf_counter()
+        result = compute()
+        self.record({"kind": kind, "key": key, "seconds": time.perf_counter() - start, "result": result})
+        return result
+
+    def intercept_search(self, tool: str, query: str, search: Callable[[str], str]) -> str:
+        """Search interceptor for app.utils.tools"""
+        return self.intercept("search", lambda: search(query), tool, query)
+
+    def intercept_local_classification(self, question: str, classify: Callable[[str], Optional[str]]) -> Optional[str]:
+        """Local classifier interceptor; its cache-dependent answers decide which agents run"""
+        return self.intercept("local", lambda: classify(question), question)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"path": self.path, "recorded": self.recorded, "replayed": self.replayed, "misses": self.misses}
+
+
+class RecordingLLM(LLM):
+    """CrewAI LLM that writes every request's response, latency and token usage to a cassette"""
+
+    def __init__(self, cassette: Cassette, key_model: str, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+        # Keyed on the bare model name so replays match whatever provider prefix was used
+        self.key_model = key_model
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None):
+        processes = [getattr(callback, "token_cost_process", None) for callback in callbacks or []]
+        processes = [process for process in processes if process is not None]
+        before = [(process.prompt_tokens, process.completion_tokens) for process in processes]
+
+        start = time.perf_counter()
+        response = super().call(messages, tools, callbacks, available_functions)
+        seconds = time.perf_counter() - start
+
+        usage = None
+        if processes:
+            usage = (processes[0].prompt_tokens - before[0][0], processes[0].completion_tokens - before[0][1])
+        self.cassette.record({
+            "kind": "llm",
+            "key": _llm_key(self.key_model, messages),
+            "model": self.model,
+            "seconds": seconds,
+            "usage": usage,
+            "response": response if isinstance(response, str) else str(response)
+        })
+        return response
+
+
+class ReplayLLM(CannedLLM):
+    """Offline LLM that answers from a cassette with the recorded, optionally scaled, timings"""
+
+    def __init__(self, model: str, cassette: Cassette):
+        super().__init__(model)
+        self.cassette = cassette
+
+    def answer(self, messages) -> Tuple[str, float, Optional[Tuple[int, int]]]:
+        entry = self.cassette.replay(_llm_key(self.model, messages))
+        usage = tuple(entry["usage"]) if entry.get("usage") else None
+        return entry["response"], self.cassette.delay(entry), usage
+
+
+active_cassette: Optional[Cassette] = None
+
+
+def install_cassette(mode: str = CASSETTE_MODE, path: str = CASSETTE_PATH,
+                     time_scale: float = CASSETTE_TIME_SCALE) -> Optional[Cassette]:
+    """Route LLM and search calls through a cassette in "record" or "replay" mode"""
+    global active_cassette
+    if mode not in ("record", "replay"):
+        return None
+    # Streamlit re-runs its script on every interaction; keep the cassette already in place
+    if active_cassette is not None and (active_cassette.mode, active_cassette.path) == (mode, path):
+        return active_cassette
+
+    cassette = Cassette(path, mode, time_scale)
+    if mode == "replay":
+        cassette.load()
+        llm_manager.llm_factory = lambda provider, model: ReplayLLM(model, cassette)
+    else:
+        def recording_llm(provider: str, model: str) -> RecordingLLM:
+            shared_http_client()
+            if provider == "groq":
+                return RecordingLLM(cassette, model, model=f"groq/{model}",
+                                    api_key=llm_manager.groq_api_key, temperature=0.1)
+            return RecordingLLM(cassette, model, model=model, api_key=llm_manager.openai_api_key, temperature=0.1)
+
+        llm_manager.llm_factory = recording_llm
+
+    tools.search_interceptor = cassette.intercept_search
+    classification.local_interceptor = cassette.intercept_local_classification
+    # Agent templates hold their LLM, so rebuild them on the cassette-backed clients
+    registry.clear()
+    active_cassette = cassette
+    return cassette
@@ -0,0 +1,277 @@
+import asyncio
+import json
+import os
+import re
+from itertools import islice
+from crewai import Task, Crew, Process
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+from app.utils.agents import create_classifier_agent, llm_manager
+from app.utils.bulk import BulkEngine, is_overload_error
+from app.utils.cache import ClassificationCache, fingerprint
+from app.utils.event_log import CREW_VERBOSE
+from app.utils.fewshot import CLASSIFIER_PROMPT_MODE, FEW_SHOT_PER_CATEGORY, few_shot_prompts
+from app.utils.metrics import bind_agents, record_crew_usage, request_trace, span
+from app.utils.prompts import CLASSIFICATION_CATEGORIES, get_classification_prompt
+from app.utils.rules import rule_engine
+from app.utils.knn import knn_classifier
+
+# Number of questions packed into one classification request
+CLASSIFICATION_BATCH_SIZE = int(os.getenv("CLASSIFICATION_BATCH_SIZE", "20"))
+
+CLASSIFICATION_RULES = """
+            Categories: Mathematical, Definition, Formulation, Inferential,
+            Differentiation, Analytical, Statistical, Inference
+
+            Rules:
+            - When word "define" is used, return "Definition"
+            - When word "theory" is used, return "Definition"
+            - When word "differentiate" is used, return "Differentiation"
+            - When mathematical calculations/numbers/equations are used, return "Mathematical"
+"""
+
+# Keyed by every model the classifier may be routed to, so a change of provider or model starts afresh
+classification_cache = ClassificationCache(
+    fingerprint(get_classification_prompt(), CLASSIFICATION_RULES, *llm_manager.agent_models("classifier"),
+                CLASSIFIER_PROMPT_MODE, str(FEW_SHOT_PER_CATEGORY))
+)
+
+
+# Optional (question, classify) -> category hook around local classification, e.g. for record/replay
+local_interceptor = None
+
+
+def classify_locally(question: str) -> Optional[str]:
+    """Classify a question without an LLM call, or return None to fall through"""
+    if local_interceptor is not None:
+        return local_interceptor(question, _classify_locally)
+    return _classify_locally(question)
+
+
+def _classify_locally(question: str) -> Optional[str]:
+    return (
+        rule_engine.classify(question)
+        or classification_cache.get(question)
+        or knn_classifier.classify(question)
+    )
+
+
+def remember_classification(question: str, answer: str) -> Optional[str]:
+    """Cache an LLM classification if it is a valid category, and return the category"""
+    category = normalize_category(answer)
+    if category:
+        classification_cache.set(question, category)
+    return category
+
+
+def local_classification_stats() -> dict:
+    """Return how many questions each local stage decided"""
+    return {
+        "rules": rule_engine.stats(),
+        "cache": classification_cache.stats(),
+        "knn": knn_classifier.stats(),
+        "prompt": few_shot_prompts.stats()
+    }
+
+
+def normalize_category(text: str) -> Optional[str]:
+    """Map an LLM answer such as "**Definition**" onto a known category name"""
+    cleaned = re.sub(r"[^a-z]", "", str(text).lower())
+    for category in CLASSIFICATION_CATEGORIES:
+        if cleaned == category.lower():
+            return category
+    return None
+
+
+def _kickoff(task: Task, agent) -> str:
+    """Run a single-task crew and return its raw text output"""
+    crew = Crew(
+        agents=[agent],
+        tasks=[task],
+        verbose=CREW_VERBOSE,
+        process=Process.sequential
+    )
+    bind_agents(crew.agents)
+    with span("llm_classification"):
+        result = crew.kickoff()
+    record_crew_usage(crew)
+
+    # Extract the result text
+    if hasattr(result, 'raw'):
+        return result.raw.strip()
+    elif hasattr(result, 'result'):
+        return result.result.strip()
+    else:
+        return str(result).strip()
+
+
+def classify_with_llm(question: str) -> str:
+    """Classify a single question with the classifier agent"""
+    classifier_agent = create_classifier_agent()
+
+    task = Task(
+        description=f"""
+            Classify this question: {question}
+            {CLASSIFICATION_RULES}
+{few_shot_prompts.examples_block([question])}
+            Return ONLY the category name.
+            """,
+        expected_output="A single category name",
+        agent=classifier_agent,
+        name="classification"
+    )
+
+    answer = _kickoff(task, classifier_agent)
+    return remember_classification(question, answer) or answer
+
+
+def classify_validated(question: str, attempts: int = 2) -> str:
+    """Classify with the LLM, asking again when the answer is not a category, and report an error otherwise"""
+    for _ in range(attempts):
+        answer = classify_with_llm(question)
+        category = normalize_category(answer)
+        if category:
+            return category
+    return f"Classification Error: invalid category {answer!r}"
+
+
+def classify_question(question: str) -> str:
+    """Classify a question locally when possible, otherwise with the LLM"""
+    return classify_locally(question) or classify_with_llm(question)
+
+
+def parse_batch_response(text: str, question_ids: List[str]) -> Dict[str, str]:
+    """Extract the valid {question_id: category} pairs from a batch answer"""
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not match:
+        return {}
+    try:
+        answer = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(answer, dict):
+        return {}
+
+    categories = {}
+    for question_id in question_ids:
+        category = normalize_category(answer.get(question_id, ""))
+        if category:
+            categories[question_id] = category
+    return categories
+
+
+def classify_batch_with_llm(questions: List[str]) -> Dict[str, str]:
+    """Classify several questions in one LLM request, keyed by question ID"""
+    classifier_agent = create_classifier_agent()
+    question_ids = [f"Q{i}" for i in range(1, len(questions) + 1)]
+    numbered = "\n".join(
+        f"            {question_id}: {' '.join(str(question).split())}"
+        for question_id, question in zip(question_ids, questions)
+    )
+
+    task = Task(
+        description=f"""
+            Classify each of the following questions independently:
+
+{numbered}
+            {CLASSIFICATION_RULES}
+{few_shot_prompts.examples_block(questions)}
+            Return ONLY a JSON object mapping every question ID to its category name,
+            for example {{"Q1": "Mathematical", "Q2": "Definition"}}.
+            """,
+        expected_output="A JSON object mapping each question ID to a single category name",
+        agent=classifier_agent,
+        name="classification_batch"
+    )
+
+    return parse_batch_response(_kickoff(task, classifier_agent), question_ids)
+
+
+def classify_batch(questions: List[str], batch_size: int = CLASSIFICATION_BATCH_SIZE) -> List[str]:
+    """Classify questions in packed LLM requests, retrying missing or invalid items one by one"""
+    results: List[Optional[str]] = [classify_locally(question) for question in questions]
+    pending = [i for i, category in enumerate(results) if category is None]
+
+    for start in range(0, len(pending), max(1, batch_size)):
+        chunk = pending[start:start + max(1, batch_size)]
+        if len(chunk) > 1:
+            try:
+                with span("classification_batch"):
+                    answers = classify_batch_with_llm([questions[i] for i in chunk])
+            except Exception as e:
+                # Let the bulk engine back off instead of retrying into a rate limit
+                if is_overload_error(e):
+                    raise
+                answers = {}
+            for position, i in enumerate(chunk, 1):
+                results[i] = answers.get(f"Q{position}")
+                if results[i]:
+                    classification_cache.set(questions[i], results[i])
+
+        # Per-item retry for anything the batch answer left out or got wrong
+        for i in chunk:
+            if results[i] is None:
+                try:
+                    results[i] = classify_validated(questions[i])
+                except Exception as e:
+                    if is_overload_error(e):
+                        raise
+                    results[i] = f"Classification Error: {str(e)}"
+
+    return results
+
+
+def _bulk_engine(batch_size: int, max_concurrency: Optional[int]) -> BulkEngine:
+    engine_options = {"max_concurrency": max_concurrency} if max_concurrency else {}
+    return BulkEngine(
+        lambda chunk: classify_batch(chunk, batch_size),
+        on_error=lambda chunk, e: [f"Classification Error: {str(e)}"] * len(chunk),
+        **engine_options
+    )
+
+
+def _bulk_classification(questions: List[str], batch_size: int, max_concurrency: Optional[int]):
+    batch_size = max(1, batch_size)
+    chunks = [questions[i:i + batch_size] for i in range(0, len(questions), batch_size)]
+    return _bulk_engine(batch_size, max_concurrency), chunks
+
+
+async def classify_many_async(questions: List[str], batch_size: int = CLASSIFICATION_BATCH_SIZE,
+                              on_progress: Optional[Callable[[int, int], None]] = None,
+                              max_concurrency: Optional[int] = None) -> List[str]:
+    """Classify questions through the adaptive worker pool, one batch request per worker call"""
+    engine, chunks = _bulk_classification(questions, batch_size, max_concurrency)
+    with request_trace("bulk_classification", questions=len(questions), batch_size=batch_size):
+        results = await engine.run(chunks, on_progress)
+    return [category for chunk_results in results for category in chunk_results]
+
+
+async def classify_stream(rows: Iterable[Tuple[Any, str]], batch_size: int = CLASSIFICATION_BATCH_SIZE,
+                          max_concurrency: Optional[int] = None,
+                          window_rows: int = 1000) -> AsyncIterator[List[Tuple[Any, str, str]]]:
+    """Classify (key, question) rows read lazily, yielding each batch's (key, question, category) as it finishes.
+
+    One worker pool serves the whole input and keeps at most window_rows rows in flight.
+    """
+    batch_size = max(1, batch_size)
+    rows = iter(rows)
+    batches = iter(lambda: list(islice(rows, batch_size)), [])
+    # The worker sees only the questions; keys ride along in the held batch
+    held: Dict[int, List[Tuple[Any, str]]] = {}
+
+    def questions():
+        for position, batch in enumerate(batches):
+            held[position] = batch
+            yield [question for _, question in batch]
+
+    engine = _bulk_engine(batch_size, max_concurrency)
+    with request_trace("bulk_classification", batch_size=batch_size, streamed=True):
+        async for position, categories in engine.stream(questions(), max(1, window_rows // batch_size)):
+            batch = held.pop(position)
+            yield [(key, question, category) for (key, question), category in zip(batch, categories)]
+
+
+def classify_many(questions: List[str], batch_size: int = CLASSIFICATION_BATCH_SIZE,
+                  on_progress: Optional[Callable[[int, int], None]] = None,
+                  max_concurrency: Optional[int] = None) -> List[str]:
+    """Blocking wrapper around classify_many_async"""
+    return asyncio.run(classify_many_async(questions, batch_size, on_progress, max_concurrency))
@@ -0,0 +1,130 @@
+import os
+import re
+import threading
+from typing import List, Optional
+import numpy as np
+from app.utils.embeddings import HashedTfidfVectorizer
+from app.utils.metrics import RequestTrace, current_trace, metrics
+from app.utils.tokens import count_tokens, truncate_tokens
+
+# Tokens of search evidence or upstream task output the coordinator prompt may carry
+COORDINATOR_CONTEXT_TOKENS = int(os.getenv("COORDINATOR_CONTEXT_TOKENS", "1200"))
+# No single evidence item or task output gets more than this, whatever the budget leaves
+CONTEXT_ITEM_MAX_TOKENS = int(os.getenv("CONTEXT_ITEM_MAX_TOKENS", "300"))
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n+")
+# Summaries and snippets front-load their gist, so earlier sentences get a small bonus
+LEAD_BONUS = 0.1
+
+_vectorizer = HashedTfidfVectorizer()
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+
+def compress_text(text: str, max_tokens: int, question: str) -> str:
+    """Keep the sentences most relevant to the question, in their original order, within max_tokens"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    sentences = split_sentences(text)
+    if len(sentences) <= 1:
+        return truncate_tokens(text, max_tokens)
+
+    scores = _vectorizer.transform(sentences) @ _vectorizer.embed(question)
+    scores += LEAD_BONUS / (1 + np.arange(len(sentences)))
+    # Counted with the joining space, so the result stays within max_tokens
+    lengths = [count_tokens(" " + sentence) for sentence in sentences]
+
+    chosen, seen, used = [], set(), 0
+    for i in np.argsort(-scores):
+        key = sentences[i].lower()
+        if key not in seen and used + lengths[i] <= max_tokens:
+            chosen.append(i)
+            seen.add(key)
+            used += lengths[i]
+    if not chosen:
+        return truncate_tokens(sentences[int(np.argmax(scores))], max_tokens)
+    return " ".join(sentences[i] for i in sorted(chosen))
+
+
+def allocate(sizes: List[int], budget: int) -> List[int]:
+    """Split a token budget so items under their fair share keep everything and the rest share what is left"""
+    limits = [0] * len(sizes)
+    remaining = sorted(range(len(sizes)), key=lambda i: sizes[i])
+    while remaining:
+        share = budget // len(remaining)
+        i = remaining[0]
+        if sizes[i] > share:
+            for j in remaining:
+                limits[j] = share
+            break
+        limits[i] = sizes[i]
+        budget -= sizes[i]
+        remaining.pop(0)
+    return limits
+
+
+class ContextBudget:
+    """Compresses what the coordinator reads to a token budget and counts the tokens it saves"""
+
+    def __init__(self, budget: int = COORDINATOR_CONTEXT_TOKENS, item_max: int = CONTEXT_ITEM_MAX_TOKENS):
+        self.budget = budget
+        self.item_max = item_max
+        self._lock = threading.Lock()
+        self.compressions = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    def compress(self, question: str, texts: List[str], budget: Optional[int] = None,
+                 trace: Optional[RequestTrace] = None) -> List[str]:
+        """Compress texts that share one budget, recording the savings against the request's trace"""
+        sizes = [count_tokens(text) for text in texts]
+        limits = allocate([min(size, self.item_max) for size in sizes], self.budget if budget is None else budget)
+        compressed = [
+            text if size <= limit else compress_text(text, limit, question)
+            for text, size, limit in zip(texts, sizes, limits)
+        ]
+        self._record(sum(sizes), sum(count_tokens(text) for text in compressed), trace)
+        return compressed
+
+    def compress_evidence(self, question: str, evidence: List[dict]) -> List[dict]:
+        """Fit federated search evidence into the budget by compressing its snippets"""
+        overhead = sum(count_tokens(f"[{i}] {entry['title']} — {entry['url']}") for i, entry in enumerate(evidence, 1))
+        snippets = self.compress(question, [entry["snippet"] for entry in evidence], max(self.budget - overhead, 0))
+        return [{**entry, "snippet": snippet} for entry, snippet in zip(evidence, snippets)]
+
+    def output_compressor(self, question: str, outputs: int):
+        """Task callback that compresses an upstream agent's output in place before the coordinator reads it"""
+        # Async tasks finish on CrewAI's threads, which do not see the request's trace
+        trace = current_trace()
+        budget = self.budget // max(outputs, 1)
+
+        def compress(output):
+            output.raw = self.compress(question, [output.raw], budget, trace)[0]
+
+        return compress
+
+    def _record(self, before: int, after: int, trace: Optional[RequestTrace]):
+        with self._lock:
+            self.compressions += 1
+            self.tokens_before += before
+            self.tokens_after += after
+        metrics.inc("context_tokens_total", before, stage="before")
+        metrics.inc("context_tokens_total", after, stage="after")
+        trace = trace or current_trace()
+        if trace is not None:
+            trace.accumulate("context_tokens", before=before, after=after, saved=before - after)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "budget": self.budget,
+                "compressions": self.compressions,
+                "tokens_before": self.tokens_before,
+                "tokens_after": self.tokens_after,
+                "tokens_saved": self.tokens_before - self.tokens_after
+            }
+
+
+context_budget = ContextBudget()
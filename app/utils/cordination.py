@@ -5,21 +5,79 @@ from app.utils.agents import (
     create_tavily_agent,
     create_coordinator_agent
 )
+from app.utils.classification import (
+    CLASSIFICATION_RULES,
+    classify_locally,
+    classify_with_llm,
+    normalize_category,
+    remember_classification
+)
+from app.utils.answer_cache import answer_cache
+from app.utils.context_budget import context_budget
+from app.utils.event_log import CREW_VERBOSE, event_log
+from app.utils.federated import FEDERATED_SEARCH, federated_search, format_evidence
+from app.utils.fewshot import few_shot_prompts
+from app.utils.metrics import bind_agents, record_crew_usage, request_trace, span
+from app.utils.routing import SEARCH_PROVIDERS, pipeline_router
+from app.utils.singleflight import Flight, analysis_flights
+from app.utils.streaming import TokenStreamHandler
 import asyncio
-from typing import AsyncGenerator, Optional
+import logging
+import os
+import threading
+import time
+from typing import AsyncGenerator, Iterator, List, Optional, Sequence
+
+# Run the classifier and both search tasks as a parallel fan-out by default
+CONCURRENT_TASKS = os.getenv("CREW_CONCURRENT_TASKS", "true").lower() in ("1", "true", "yes")
+
+def crew_fans_out() -> bool:
+    """Whether analysis crews normally have upstream tasks for the concurrent mode to overlap.
+
+    With adaptive routing and federated search the category and evidence are
+    resolved before the crew is built, which then holds only the coordinator.
+    """
+    return not (pipeline_router.enabled and FEDERATED_SEARCH)
+
 
 class QuestionClassifierCrew:
     """CrewAI implementation of the Question Classifier system"""
     
-    def __init__(self, streaming_callback=None):
+    def __init__(self, streaming_callback=None, concurrent: Optional[bool] = None):
         self.streaming_callback = streaming_callback
-        self.classifier_agent = create_classifier_agent(streaming_callback)
-        self.duckduckgo_agent = create_duckduckgo_agent(streaming_callback)
-        self.tavily_agent = create_tavily_agent(streaming_callback)
+        self.concurrent = CONCURRENT_TASKS if concurrent is None else concurrent
+        self.last_run_seconds: Optional[float] = None
+        self.last_trace: Optional[dict] = None
+        # Serve near-duplicates of answered questions from the semantic answer cache
+        self.use_answer_cache = True
+        # Attach to an identical analysis already in flight instead of running another crew
+        self.coalesce = analysis_flights.enabled
+        self.classifier_agent = create_classifier_agent()
+        self.duckduckgo_agent = create_duckduckgo_agent()
+        self.tavily_agent = create_tavily_agent()
+        # Only the coordinator's answer reaches the user, so only it streams
         self.coordinator_agent = create_coordinator_agent(streaming_callback)
         
     def create_classification_task(self, question: str) -> Task:
         """Create a task for question classification"""
+        examples = few_shot_prompts.examples_block([question])
+        if examples:
+            # The compact agent goal already lists the categories; send only the nearest examples
+            return Task(
+                description=f"""
+            Classify the following question into one of the predefined categories:
+            
+            Question: {question}
+            {CLASSIFICATION_RULES}
+{examples}
+            
+            Respond with ONLY the category name that best fits the question.
+            """,
+                expected_output="A single category name from the predefined list",
+                agent=self.classifier_agent,
+                name="classification"
+            )
+        
         return Task(
             description=f"""
             Classify the following question into one of the predefined categories:
@@ -45,7 +103,8 @@ class QuestionClassifierCrew:
             Respond with ONLY the category name that best fits the question.
             """,
             expected_output="A single category name from the predefined list",
-            agent=self.classifier_agent
+            agent=self.classifier_agent,
+            name="classification"
         )
     
     def create_duckduckgo_search_task(self, question: str) -> Task:
@@ -67,7 +126,8 @@ class QuestionClassifierCrew:
             Return a well-structured response with clear explanations.
             """,
             expected_output="Comprehensive answer based on DuckDuckGo search results with source citations",
-            agent=self.duckduckgo_agent
+            agent=self.duckduckgo_agent,
+            name="duckduckgo_search"
         )
     
     def create_tavily_search_task(self, question: str) -> Task:
@@ -89,20 +149,85 @@ class QuestionClassifierCrew:
             Return a detailed response with thorough explanations.
             """,
             expected_output="Detailed answer based on Tavily search results with comprehensive analysis",
-            agent=self.tavily_agent
+            agent=self.tavily_agent,
+            name="tavily_search"
         )
     
-    def create_coordination_task(self, question: str) -> Task:
+    def create_coordination_task(self, question: str, category: Optional[str] = None,
+                                 providers: Sequence[str] = SEARCH_PROVIDERS,
+                                 evidence: Optional[List[dict]] = None, coordinator: Optional[Agent] = None) -> Task:
         """Create a coordination task to synthesize all results"""
+        coordinator = coordinator or self.coordinator_agent
+        classification_note = (
+            f"\n            The question has already been classified as: {category}\n"
+            if category else ""
+        )
+        if providers and evidence is not None:
+            # Federated search already gathered, deduplicated and ranked the sources
+            evidence_block = format_evidence(evidence) or (
+                "Web search returned no usable results; say so and answer from your own knowledge."
+            )
+            return Task(
+                description=f"""
+            Answer the following question using the search evidence below:
+            
+            Question: {question}
+            {classification_note}
+            Search evidence (deduplicated and ranked across providers):
+{evidence_block}
+            
+            Your task:
+            1. Review the classification result from the classifier agent, if there is one
+            2. Use the evidence that is relevant and ignore the rest
+            3. Synthesize it into a comprehensive, coherent response that addresses all aspects of the question
+            4. Cite evidence by its [number]
+            
+            Structure your response as follows:
+            - Question Category: [Classification result]
+            - Comprehensive Answer: [Synthesized information with [number] citations]
+            - Key Insights: [Important points and takeaways]
+            - Sources: [Title and URL of each cited item]
+            """,
+                expected_output="A comprehensive, well-structured answer with classification, cited synthesis of the evidence, key insights, and sources",
+                agent=coordinator,
+                context=[],
+                name="coordination"
+            )
+        
+        if not providers:
+            # Routed without web search: the coordinator answers on its own
+            return Task(
+                description=f"""
+            Answer the following question directly; no web search was run for it:
+            
+            Question: {question}
+            {classification_note}
+            Your task:
+            1. Work through the question step by step, showing any calculations or reasoning
+            2. Check the result before presenting it
+            3. Present the final answer in a clear, well-structured format
+            
+            Structure your response as follows:
+            - Question Category: [Classification result]
+            - Comprehensive Answer: [Step-by-step solution and result]
+            - Key Insights: [Important points and takeaways]
+            """,
+                expected_output="A well-structured answer with classification, a step-by-step solution and key insights",
+                agent=coordinator,
+                context=[],
+                name="coordination"
+            )
+        
+        search_agents = " and ".join({"duckduckgo": "DuckDuckGo", "tavily": "Tavily"}[name] for name in providers)
         return Task(
             description=f"""
             Coordinate and synthesize the results from classification and search tasks for this question:
             
             Question: {question}
-            
+            {classification_note}
             Your task:
             1. Review the classification result from the classifier agent
-            2. Analyze the search results from both DuckDuckGo and Tavily agents
+            2. Analyze the search results from the {search_agents} {"agents" if len(providers) > 1 else "agent"}
             3. Synthesize all information into a comprehensive, coherent response
             4. Ensure the answer addresses all aspects of the user's question
             5. Present the final answer in a clear, well-structured format
@@ -116,87 +241,285 @@ class QuestionClassifierCrew:
             Provide a complete, accurate, and helpful response that fully satisfies the user's query.
             """,
             expected_output="A comprehensive, well-structured answer with classification, synthesis of search results, key insights, and sources",
-            agent=self.coordinator_agent,
-            context=[]  # Will be populated with previous tasks
+            agent=coordinator,
+            context=[],  # Will be populated with previous tasks
+            name="coordination"
         )
     
-    def create_crew(self, question: str) -> Crew:
-        """Create a crew for processing a question"""
+    def preclassify(self, question: str) -> Optional[str]:
+        """Classify the question locally when possible, skipping the classifier agent"""
+        with span("local_classification"):
+            return classify_locally(question)
+    
+    def route(self, question: str, category: Optional[str] = None) -> Optional[str]:
+        """Classify before building the crew so the category's pipeline plan can be applied"""
+        if category is None:
+            category = self.preclassify(question)
+        if category is None and pipeline_router.enabled:
+            category = normalize_category(classify_with_llm(question))
+        return category
+    
+    def create_crew(self, question: str, concurrent: Optional[bool] = None, category: Optional[str] = None,
+                    providers: Optional[Sequence[str]] = None, evidence: Optional[List[dict]] = None,
+                    coordinator: Optional[Agent] = None) -> Crew:
+        """Create a crew for processing a question; coordinator replaces the instance's, e.g. to stream one run"""
+        coordinator = coordinator or self.coordinator_agent
+        concurrent = self.concurrent if concurrent is None else concurrent
+        if category is None:
+            category = self.preclassify(question)
+        if providers is None:
+            providers = pipeline_router.plan(category)
+        if evidence is None and FEDERATED_SEARCH and providers:
+            evidence, _ = federated_search(question, providers)
+            evidence = context_budget.compress_evidence(question, evidence)
         
-        # Create all tasks
-        classification_task = self.create_classification_task(question)
-        duckduckgo_task = self.create_duckduckgo_search_task(question)
-        tavily_task = self.create_tavily_search_task(question)
-        coordination_task = self.create_coordination_task(question)
+        # Create the tasks of the plan, leaving out the classifier when the category is already known
+        # and the search agents when federated search has gathered the evidence
+        agents, upstream_tasks = [], []
+        if evidence is None:
+            search_agents = {"duckduckgo": self.duckduckgo_agent, "tavily": self.tavily_agent}
+            search_tasks = {"duckduckgo": self.create_duckduckgo_search_task, "tavily": self.create_tavily_search_task}
+            agents = [search_agents[name] for name in providers]
+            upstream_tasks = [search_tasks[name](question) for name in providers]
+            # Search agents summarise at length; trim their answers to the coordinator's budget
+            for task in upstream_tasks:
+                task.callback = context_budget.output_compressor(question, len(upstream_tasks))
+        if category is None:
+            classification_task = self.create_classification_task(question)
+            # Cache the agent's answer so the next run of this question skips it
+            classification_task.callback = lambda output: remember_classification(question, output.raw)
+            agents.insert(0, self.classifier_agent)
+            upstream_tasks.insert(0, classification_task)
+        coordination_task = self.create_coordination_task(question, category, providers, evidence, coordinator)
+        
+        # The coordinator is the only task that depends on the others, so in
+        # concurrent mode the upstream tasks run as a parallel fan-out and the
+        # coordinator waits on all of them through its context
+        if concurrent:
+            for task in upstream_tasks:
+                task.async_execution = True
         
         # Set context for coordination task
-        coordination_task.context = [classification_task, duckduckgo_task, tavily_task]
+        coordination_task.context = upstream_tasks
         
         # Create and return the crew
         return Crew(
-            agents=[
-                self.classifier_agent,
-                self.duckduckgo_agent, 
-                self.tavily_agent,
-                self.coordinator_agent
-            ],
-            tasks=[
-                classification_task,
-                duckduckgo_task,
-                tavily_task,
-                coordination_task
-            ],
+            agents=agents + [coordinator],
+            tasks=upstream_tasks + [coordination_task],
             process=Process.sequential,
-            verbose=True,
-            output_log_file="question_classifier_crew.log"
+            verbose=CREW_VERBOSE
         )
     
-    def run(self, question: str) -> str:
-        """Run the crew to process a question"""
+    def _kickoff(self, question: str, concurrent: Optional[bool] = None, coordinator: Optional[Agent] = None) -> str:
+        concurrent = self.concurrent if concurrent is None else concurrent
+        try:
+            with request_trace("analysis", question=question, concurrent=concurrent) as trace:
+                start = time.perf_counter()
+                category = self.preclassify(question)
+                if self.use_answer_cache:
+                    with span("answer_cache"):
+                        cached = answer_cache.get(question, category)
+                    if cached is not None:
+                        answer, match = cached
+                        trace.attributes.update(answer_cache=match)
+                        self.last_run_seconds = time.perf_counter() - start
+                        return answer
+                category = self.route(question, category)
+                providers = pipeline_router.plan(category)
+                trace.attributes.update(category=category, plan=list(providers))
+                evidence = None
+                if FEDERATED_SEARCH and providers:
+                    evidence, errors = federated_search(question, providers)
+                    evidence = context_budget.compress_evidence(question, evidence)
+                    trace.attributes.update(evidence=len(evidence), search_errors=errors)
+                with span("crew_setup"):
+                    crew = self.create_crew(question, concurrent, category, providers, evidence, coordinator)
+                trace.attributes.update(upstream_tasks=len(crew.tasks) - 1)
+                bind_agents(crew.agents)
+                with span("crew_kickoff"):
+                    result = crew.kickoff()
+                self.last_run_seconds = time.perf_counter() - start
+                record_crew_usage(crew)
+        finally:
+            self.last_trace = trace.to_dict()
+            event_log.emit(
+                "analysis_finished", logging.ERROR if self.last_trace["error"] else logging.INFO,
+                request_id=trace.id, category=self.last_trace.get("category"),
+                plan=self.last_trace.get("plan"), cached="answer_cache" in self.last_trace,
+                evidence=self.last_trace.get("evidence"), seconds=self.last_trace["seconds"],
+                prompt_tokens=self.last_trace["prompt_tokens"],
+                completion_tokens=self.last_trace["completion_tokens"], error=self.last_trace["error"]
+            )
+        pipeline_router.record(category, providers, self.last_trace)
+        answer = result.raw if hasattr(result, 'raw') else str(result)
+        answer_cache.set(question, answer, category)
+        return answer
+    
+    def _lead(self, question: str, concurrent: Optional[bool], flight: Flight) -> str:
+        # Streaming requests that attach to this run get the answer in one piece
+        flight.publish({"type": "status", "message": "Starting question analysis...", "agent": "System"})
         try:
-            crew = self.create_crew(question)
-            result = crew.kickoff()
-            return result.raw if hasattr(result, 'raw') else str(result)
+            answer = self._kickoff(question, concurrent)
         except Exception as e:
-            return f"Error processing question: {str(e)}"
+            flight.publish({"type": "error", "error": str(e), "agent": "System"})
+            flight.finish(error=e, trace=self.last_trace)
+            raise
+        finally:
+            analysis_flights.land(flight)
+        for event in self._completion_events(answer, None):
+            flight.publish(event)
+        flight.finish(answer, trace=self.last_trace)
+        return answer
     
-    async def stream_run(self, question: str) -> AsyncGenerator[dict, None]:
-        """Stream the crew execution for real-time updates"""
+    def _follow(self, flight: Flight) -> str:
+        start = time.perf_counter()
         try:
-            yield {"type": "status", "message": "Starting question analysis...", "agent": "System"}
-            
-            crew = self.create_crew(question)
-            
-            # Execute the crew
-            result = crew.kickoff()
-            
-            # Stream the final result
-            final_result = result.raw if hasattr(result, 'raw') else str(result)
-            
-            # Stream the content in chunks for better UX
-            chunk_size = 100
-            for i in range(0, len(final_result), chunk_size):
-                chunk = final_result[i:i+chunk_size]
-                yield {
-                    "type": "token",
-                    "content": chunk,
-                    "agent": "Coordinator"
-                }
-                await asyncio.sleep(0.01)  # Small delay for streaming effect
-            
-            yield {"type": "status", "message": "Analysis completed", "agent": "System"}
-            
+            return flight.wait()
+        finally:
+            self.last_run_seconds = time.perf_counter() - start
+            self.last_trace = flight.trace and {**flight.trace, "coalesced": True}
+    
+    def run(self, question: str, concurrent: Optional[bool] = None) -> str:
+        """Run the crew to process a question, or wait for an identical one already in flight"""
+        self.last_run_seconds = None
+        self.last_trace = None
+        try:
+            if not self.coalesce:
+                return self._kickoff(question, concurrent)
+            flight, leader = analysis_flights.join(question)
+            if leader:
+                return self._lead(question, concurrent, flight)
+            return self._follow(flight)
         except Exception as e:
-            yield {
-                "type": "error",
-                "error": str(e),
+            return f"Error processing question: {str(e)}"
+    
+    def compare_execution_modes(self, question: str) -> dict:
+        """Run the question sequentially and concurrently and compare latency.
+
+        upstream_tasks is how many tasks the concurrent run could overlap; with none
+        the two modes run the same single task and no speedup is expected.
+        """
+        timings = {}
+        # Both runs must execute the crew rather than replay the first answer
+        self.use_answer_cache = self.coalesce = False
+        try:
+            for mode, concurrent in (("sequential", False), ("concurrent", True)):
+                self.run(question, concurrent=concurrent)
+                timings[mode] = self.last_run_seconds
+                timings["upstream_tasks"] = (self.last_trace or {}).get("upstream_tasks")
+        finally:
+            self.use_answer_cache = True
+            self.coalesce = analysis_flights.enabled
+        
+        if timings["sequential"] and timings["concurrent"]:
+            timings["speedup"] = timings["sequential"] / timings["concurrent"]
+        return timings
+    
+    def _completion_events(self, answer: str, time_to_first_token: Optional[float]) -> List[dict]:
+        return [
+            {"type": "token", "content": answer, "agent": "Coordinator"},
+            *self._closing_events(time_to_first_token)
+        ]
+    
+    def _closing_events(self, time_to_first_token: Optional[float]) -> List[dict]:
+        return [
+            {
+                "type": "metrics",
+                "time_to_first_token": time_to_first_token,
+                "total_seconds": self.last_run_seconds,
+                "trace": self.last_trace,
                 "agent": "System"
-            }
+            },
+            {"type": "status", "message": "Analysis completed", "agent": "System"}
+        ]
+    
+    def _stream_events(self, question: str, concurrent: Optional[bool] = None) -> Iterator[dict]:
+        handler = TokenStreamHandler()
+        # Streams this run only; later runs on this instance keep the regular coordinator
+        coordinator = create_coordinator_agent(handler)
+        outcome = {}
+        
+        def work():
+            try:
+                outcome["result"] = self._kickoff(question, concurrent, coordinator)
+            except Exception as e:
+                outcome["error"] = e
+            finally:
+                handler.close()
+        
+        yield {"type": "status", "message": "Starting question analysis...", "agent": "System"}
+        worker = threading.Thread(target=work, daemon=True)
+        worker.start()
+        
+        for token in handler.tokens():
+            yield {"type": "token", "content": token, "agent": "Coordinator"}
+        worker.join()
+        
+        if "error" in outcome:
+            yield {"type": "error", "error": str(outcome["error"]), "agent": "System"}
+            return
+        
+        # Providers that do not stream still deliver the answer, just in one piece
+        if handler.streamed:
+            yield from self._closing_events(handler.time_to_first_token)
+        else:
+            yield from self._completion_events(outcome["result"], handler.time_to_first_token)
+    
+    def _lead_stream(self, question: str, concurrent: Optional[bool], flight: Flight):
+        # Runs to completion in its own thread, so attached requests finish even if this caller goes away
+        tokens, error = [], None
+        try:
+            for event in self._stream_events(question, concurrent):
+                if event["type"] == "token":
+                    tokens.append(event["content"])
+                elif event["type"] == "error":
+                    error = RuntimeError(event["error"])
+                flight.publish(event)
+        except Exception as e:
+            error = e
+            flight.publish({"type": "error", "error": str(e), "agent": "System"})
+        finally:
+            analysis_flights.land(flight)
+            flight.finish(None if error else "".join(tokens), error, self.last_trace)
+    
+    def iter_stream(self, question: str, concurrent: Optional[bool] = None) -> Iterator[dict]:
+        """Run the crew in a worker thread and yield coordinator tokens as they are generated.
+        
+        A request for a question already being analysed replays that run's events instead.
+        """
+        if not self.coalesce:
+            yield from self._stream_events(question, concurrent)
+            return
+        
+        start = time.perf_counter()
+        flight, leader = analysis_flights.join(question)
+        if leader:
+            threading.Thread(target=self._lead_stream, args=(question, concurrent, flight), daemon=True).start()
+        else:
+            yield {"type": "status", "message": "Joined an identical analysis already in progress",
+                   "agent": "System"}
+        for event in flight.stream():
+            if event["type"] == "metrics" and not leader:
+                # Report this request's own wait, and the trace of the run it attached to
+                event = {**event, "total_seconds": time.perf_counter() - start,
+                         "trace": event["trace"] and {**event["trace"], "coalesced": True}}
+                self.last_run_seconds, self.last_trace = event["total_seconds"], event["trace"]
+            yield event
+    
+    async def stream_run(self, question: str, concurrent: Optional[bool] = None) -> AsyncGenerator[dict, None]:
+        """Stream the crew execution for real-time updates"""
+        loop = asyncio.get_running_loop()
+        events = self.iter_stream(question, concurrent)
+        while True:
+            event = await loop.run_in_executor(None, next, events, None)
+            if event is None:
+                break
+            yield event
 
 # Create a factory function for easy instantiation
-def create_question_classifier_crew(streaming_callback=None) -> QuestionClassifierCrew:
+def create_question_classifier_crew(streaming_callback=None, concurrent: Optional[bool] = None) -> QuestionClassifierCrew:
     """Factory function to create a QuestionClassifierCrew instance"""
-    return QuestionClassifierCrew(streaming_callback)
+    return QuestionClassifierCrew(streaming_callback, concurrent)
 
 # Create a simple classifier-only crew for Excel processing
 def create_simple_classifier_crew(streaming_callback=None) -> Crew:
@@ -0,0 +1,65 @@
+import re
+import zlib
+import numpy as np
+from typing import Iterable, List, Optional
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and collapse whitespace so equivalent phrasings hash the same"""
+    return " ".join(str(text).lower().split())
+
+
+def extract_features(text: str) -> List[str]:
+    """Word unigrams, word bigrams and character trigrams of a text"""
+    words = TOKEN_PATTERN.findall(normalize_text(text))
+    features = [f"w:{word}" for word in words]
+    features += [f"b:{first} {second}" for first, second in zip(words, words[1:])]
+    for word in words:
+        padded = f" {word} "
+        features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    return features
+
+
+class HashedTfidfVectorizer:
+    """TF-IDF over hashed n-gram features, held in dense NumPy arrays"""
+
+    def __init__(self, n_features: int = 2 ** 14):
+        self.n_features = n_features
+        self.idf: Optional[np.ndarray] = None
+
+    def _bucket(self, feature: str) -> int:
+        # crc32 is stable across processes, unlike the built-in hash()
+        return zlib.crc32(feature.encode("utf-8")) % self.n_features
+
+    def _term_frequencies(self, texts: Iterable[str]) -> np.ndarray:
+        texts = list(texts)
+        matrix = np.zeros((len(texts), self.n_features), dtype=np.float32)
+        for row, text in enumerate(texts):
+            buckets = [self._bucket(feature) for feature in extract_features(text)]
+            if buckets:
+                np.add.at(matrix[row], buckets, 1.0)
+        # Sublinear term frequency keeps long passages from dominating
+        np.log1p(matrix, out=matrix)
+        return matrix
+
+    def fit(self, texts: Iterable[str]) -> "HashedTfidfVectorizer":
+        """Learn inverse document frequencies from a corpus"""
+        counts = self._term_frequencies(texts)
+        document_frequency = np.count_nonzero(counts, axis=0)
+        self.idf = (np.log((1 + len(counts)) / (1 + document_frequency)) + 1).astype(np.float32)
+        return self
+
+    def transform(self, texts: Iterable[str]) -> np.ndarray:
+        """Return L2-normalised vectors, one row per text"""
+        matrix = self._term_frequencies(texts)
+        if self.idf is not None:
+            matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+    def embed(self, text: str) -> np.ndarray:
+        """Return the vector for a single text"""
+        return self.transform([text])[0]
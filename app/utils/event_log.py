@@ -0,0 +1,290 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, List, Optional
+from crewai.utilities.events import crewai_event_bus
+from crewai.utilities.events.crew_events import (
+    CrewKickoffCompletedEvent,
+    CrewKickoffFailedEvent,
+    CrewKickoffStartedEvent
+)
+from crewai.utilities.events.llm_events import LLMCallCompletedEvent, LLMCallFailedEvent
+from crewai.utilities.events.task_events import TaskCompletedEvent, TaskFailedEvent, TaskStartedEvent
+from crewai.utilities.events.tool_usage_events import ToolUsageErrorEvent, ToolUsageFinishedEvent
+from app.utils.metrics import current_trace, llm_binding, metrics, model_name
+
+# One compact JSON line per pipeline event; set to an empty string to disable. Each process
+# writes its own events.<host>-<pid>.jsonl next to this path
+EVENT_LOG_PATH = os.getenv("EVENT_LOG_PATH", "logs/events.jsonl")
+# DEBUG adds every LLM and tool call; changeable at runtime through PUT /logging
+EVENT_LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Each process's file is rotated at this size, keeping EVENT_LOG_BACKUPS older files
+EVENT_LOG_MAX_BYTES = int(os.getenv("EVENT_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+EVENT_LOG_BACKUPS = int(os.getenv("EVENT_LOG_BACKUPS", "5"))
+# Files of processes that stopped writing this many days ago are deleted when a process starts logging
+EVENT_LOG_RETENTION_DAYS = float(os.getenv("EVENT_LOG_RETENTION_DAYS", "7"))
+# One JSON line per finished request trace, written per process like the events; empty disables it
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", "logs/traces.jsonl")
+# Events waiting for the writer thread; further events are dropped rather than block a request
+EVENT_LOG_QUEUE_SIZE = int(os.getenv("EVENT_LOG_QUEUE_SIZE", "10000"))
+# CrewAI's console output repeats each task prompt on every step; only for local debugging
+CREW_VERBOSE = os.getenv("CREW_VERBOSE", "false").lower() in ("1", "true", "yes")
+
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+
+
+class JsonFormatter(logging.Formatter):
+    """Render an event record as one JSON line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps({
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "event": record.msg,
+            **getattr(record, "fields", {})
+        }, ensure_ascii=False, default=str)
+
+
+class DocumentFormatter(logging.Formatter):
+    """Render a record whose message is a ready-made document, such as a request trace"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.msg, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Hands records to the writer thread as they are; formatting and file I/O happen there"""
+
+    def __init__(self, event_queue: queue.Queue, event_log: "EventLog"):
+        super().__init__(event_queue)
+        self.event_log = event_log
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.event_log.count_dropped()
+
+
+def process_log_path(path: str) -> str:
+    """The file this process writes for a shared log path, e.g. logs/events.<host>-<pid>.jsonl"""
+    stem, extension = os.path.splitext(path)
+    return f"{stem}.{socket.gethostname()}-{os.getpid()}{extension}"
+
+
+def process_log_files(path: str) -> List[str]:
+    """Every process's file for a shared log path, rotated ones included"""
+    stem, extension = os.path.splitext(path)
+    return sorted(glob.glob(f"{glob.escape(stem)}.*{extension}*"))
+
+
+def prune_process_logs(path: str, retention_days: float = EVENT_LOG_RETENTION_DAYS):
+    """Delete per-process files of a log path not written to within the retention period"""
+    if retention_days <= 0:
+        return
+    cutoff = time.time() - retention_days * 86400
+    for file_path in process_log_files(path):
+        try:
+            if os.path.getmtime(file_path) < cutoff:
+                os.remove(file_path)
+        except OSError:
+            # Another process pruned it first
+            continue
+
+
+class EventLog:
+    """Structured pipeline events written by a background thread to size-rotated JSON lines files.
+
+    Emitting checks the level and puts a record on a bounded queue, so the request
+    path never formats, writes or waits on the file. Streamlit and the uvicorn
+    workers share logs/, so each process writes and rotates a file of its own.
+    """
+
+    def __init__(self, path: Optional[str] = EVENT_LOG_PATH, level: str = EVENT_LOG_LEVEL,
+                 max_bytes: int = EVENT_LOG_MAX_BYTES, backups: int = EVENT_LOG_BACKUPS,
+                 queue_size: int = EVENT_LOG_QUEUE_SIZE, name: str = "events",
+                 formatter: Optional[logging.Formatter] = None):
+        self.path = path
+        self.name = name
+        self.formatter = formatter or JsonFormatter()
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.file_path: Optional[str] = None
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._listener: Optional[QueueListener] = None
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(f"question_prism.{name}")
+        self.logger.propagate = False
+        self.set_level(level)
+
+    @property
+    def level(self) -> str:
+        return logging.getLevelName(self.logger.level)
+
+    def set_level(self, level: str):
+        """Change the verbosity of the running process"""
+        level = level.upper()
+        if level not in LEVELS:
+            raise ValueError(f"Unknown log level {level}; expected one of {', '.join(LEVELS)}")
+        self.logger.setLevel(level)
+
+    def _start(self):
+        with self._lock:
+            if self._listener is not None:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            prune_process_logs(self.path)
+            # Resolved on first use, after uvicorn has forked its workers
+            self.file_path = process_log_path(self.path)
+            writer = RotatingFileHandler(self.file_path, maxBytes=self.max_bytes, backupCount=self.backups,
+                                         encoding="utf-8", delay=True)
+            writer.setFormatter(self.formatter)
+            self.logger.addHandler(DroppingQueueHandler(self._queue, self))
+            self._listener = QueueListener(self._queue, writer)
+            self._listener.start()
+            atexit.register(self.close)
+
+    def emit(self, event: str, level: int = logging.INFO, **fields):
+        """Log an event; request_id defaults to the current request trace"""
+        if not self.path or not self.logger.isEnabledFor(level):
+            return
+        if self._listener is None:
+            self._start()
+        if "request_id" not in fields:
+            trace = current_trace()
+            fields["request_id"] = trace.id if trace is not None else None
+        self.logger.log(level, event, extra={"fields": fields})
+
+    def write(self, document: dict):
+        """Queue a ready-made document as one line"""
+        if not self.path:
+            return
+        if self._listener is None:
+            self._start()
+        self.logger.log(logging.INFO, document)
+
+    def count_dropped(self):
+        with self._lock:
+            self.dropped += 1
+        metrics.inc("event_log_dropped_total", log=self.name)
+
+    def close(self):
+        """Flush queued events and stop the writer thread"""
+        with self._lock:
+            listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.stop()
+            for handler in list(self.logger.handlers):
+                self.logger.removeHandler(handler)
+            for handler in listener.handlers:
+                handler.close()
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "file": self.file_path,
+            "level": self.level,
+            "queued": self._queue.qsize(),
+            "dropped": self.dropped
+        }
+
+
+event_log = EventLog()
+trace_log = EventLog(TRACE_LOG_PATH, "INFO", name="traces", formatter=DocumentFormatter())
+
+# Start times of running tasks and crews, keyed by object id
+_started: Dict[int, float] = {}
+
+
+def _task_fields(task) -> dict:
+    agent = getattr(task, "agent", None)
+    _, trace = llm_binding(getattr(agent, "llm", None))
+    return {
+        "request_id": trace.id if trace is not None else None,
+        "task": getattr(task, "name", None) or "unnamed",
+        "agent": getattr(agent, "role", None),
+        "async": bool(getattr(task, "async_execution", False))
+    }
+
+
+def _elapsed(source) -> Optional[float]:
+    start = _started.pop(id(source), None)
+    return None if start is None else round(time.perf_counter() - start, 4)
+
+
+@crewai_event_bus.on(CrewKickoffStartedEvent)
+def _on_crew_started(source, event: CrewKickoffStartedEvent):
+    _started[id(source)] = time.perf_counter()
+    event_log.emit("crew_started", tasks=[task.name for task in getattr(source, "tasks", [])])
+
+
+@crewai_event_bus.on(CrewKickoffCompletedEvent)
+def _on_crew_completed(source, event: CrewKickoffCompletedEvent):
+    event_log.emit("crew_finished", status="ok", seconds=_elapsed(source))
+
+
+@crewai_event_bus.on(CrewKickoffFailedEvent)
+def _on_crew_failed(source, event: CrewKickoffFailedEvent):
+    event_log.emit("crew_finished", logging.ERROR, status="error", seconds=_elapsed(source), error=event.error)
+
+
+@crewai_event_bus.on(TaskStartedEvent)
+def _on_task_started(source, event: TaskStartedEvent):
+    _started[id(source)] = time.perf_counter()
+    event_log.emit("task_started", logging.DEBUG, **_task_fields(source))
+
+
+@crewai_event_bus.on(TaskCompletedEvent)
+def _on_task_completed(source, event: TaskCompletedEvent):
+    event_log.emit("task_finished", status="ok", seconds=_elapsed(source),
+                   output_chars=len(event.output.raw or ""), **_task_fields(source))
+
+
+@crewai_event_bus.on(TaskFailedEvent)
+def _on_task_failed(source, event: TaskFailedEvent):
+    event_log.emit("task_finished", logging.ERROR, status="error", seconds=_elapsed(source),
+                   error=event.error, **_task_fields(source))
+
+
+def _on_llm_call(source, outcome: str, level: int):
+    agent, trace = llm_binding(source)
+    event_log.emit("llm_call", level, request_id=trace.id if trace is not None else None,
+                   agent=agent, model=model_name(source), status=outcome)
+
+
+@crewai_event_bus.on(LLMCallCompletedEvent)
+def _on_llm_call_completed(source, event: LLMCallCompletedEvent):
+    _on_llm_call(source, "ok", logging.DEBUG)
+
+
+@crewai_event_bus.on(LLMCallFailedEvent)
+def _on_llm_call_failed(source, event: LLMCallFailedEvent):
+    _on_llm_call(source, "error", logging.WARNING)
+
+
+def _on_tool(source, event, status: str, level: int, **fields):
+    agent, trace = llm_binding(getattr(event.agent or getattr(source, "agent", None), "llm", None))
+    event_log.emit("tool_call", level, request_id=trace.id if trace is not None else None,
+                   agent=agent, tool=event.tool_name, status=status, **fields)
+
+
+@crewai_event_bus.on(ToolUsageFinishedEvent)
+def _on_tool_finished(source, event: ToolUsageFinishedEvent):
+    _on_tool(source, event, "ok", logging.DEBUG, from_cache=event.from_cache,
+             seconds=round((event.finished_at - event.started_at).total_seconds(), 4))
+
+
+@crewai_event_bus.on(ToolUsageErrorEvent)
+def _on_tool_error(source, event: ToolUsageErrorEvent):
+    _on_tool(source, event, "error", logging.WARNING, error=str(event.error))
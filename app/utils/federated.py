@@ -0,0 +1,130 @@
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Sequence, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from app.utils.embeddings import HashedTfidfVectorizer
+from app.utils.metrics import metrics, span
+from app.utils.tools import search_tools
+
+# Query the providers at the tool level and hand the coordinator one evidence list,
+# instead of running a search agent per provider
+FEDERATED_SEARCH = os.getenv("FEDERATED_SEARCH", "true").lower() in ("1", "true", "yes")
+FEDERATED_MAX_EVIDENCE = int(os.getenv("FEDERATED_MAX_EVIDENCE", "8"))
+# Providers that have not answered by then are left out of the evidence
+FEDERATED_TIMEOUT_SECONDS = float(os.getenv("FEDERATED_TIMEOUT_SECONDS", "15"))
+# Cosine similarity above which two snippets count as the same passage
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.85"))
+# Reciprocal rank fusion constant; larger values flatten the rank differences
+RRF_K = 60
+
+TRACKING_PARAMETERS = {"gclid", "fbclid", "msclkid", "ref", "ref_src", "mc_cid", "mc_eid"}
+
+_vectorizer = HashedTfidfVectorizer()
+# Shared across requests; each analysis submits one task per provider
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("FEDERATED_MAX_WORKERS", "8")),
+                               thread_name_prefix="federated-search")
+
+
+def canonical_url(url: str) -> str:
+    """Collapse scheme, www., tracking parameters, fragments and trailing slashes"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMETERS
+    )
+    return urlunsplit(("", host, parts.path.rstrip("/") or "/", urlencode(query), "")).lstrip("/")
+
+
+def _query_providers(question: str, providers: Sequence[str]) -> Tuple[Dict[str, List[dict]], Dict[str, str]]:
+    # Threads start from a copy of the caller's context so their spans join the request trace
+    futures = {
+        _executor.submit(contextvars.copy_context().run, search_tools[name].search_results, question): name
+        for name in providers
+    }
+    done, _ = wait(futures, timeout=FEDERATED_TIMEOUT_SECONDS)
+    results, errors = {}, {}
+    for future, name in futures.items():
+        if future not in done:
+            errors[name] = "timed out"
+        elif future.exception() is not None:
+            errors[name] = str(future.exception())
+        else:
+            results[name] = future.result()
+    return results, errors
+
+
+def merge_results(question: str, results: Dict[str, List[dict]], limit: int = FEDERATED_MAX_EVIDENCE) -> List[dict]:
+    """Deduplicate provider results by canonical URL and near-duplicate snippet, then rank them.
+
+    Ranking is reciprocal rank fusion, so a source several providers agree on rises;
+    ties go to the snippet closest to the question.
+    """
+    merged: Dict[str, dict] = {}
+    for provider, items in results.items():
+        for rank, item in enumerate(items, 1):
+            key = canonical_url(item["url"]) if item["url"] else f"{provider}:{rank}"
+            entry = merged.setdefault(key, {**item, "providers": [], "score": 0.0})
+            entry["providers"].append(provider)
+            entry["score"] += 1 / (RRF_K + rank)
+            if len(item["snippet"]) > len(entry["snippet"]):
+                entry["snippet"] = item["snippet"]
+    if not merged:
+        return []
+
+    entries = list(merged.values())
+    relevance = _vectorizer.transform([f"{entry['title']} {entry['snippet']}" for entry in entries]) \
+        @ _vectorizer.embed(question)
+    order = sorted(range(len(entries)), key=lambda i: (-entries[i]["score"], -relevance[i]))
+
+    # Walk in rank order and fold each near-duplicate passage into the better-ranked one;
+    # titles are left out since mirrors and aggregators retitle the same text
+    passages = _vectorizer.transform([entry["snippet"] or entry["title"] for entry in entries])
+    similarity = passages @ passages.T
+    kept: List[int] = []
+    for i in order:
+        duplicate_of = next((j for j in kept if similarity[i, j] >= NEAR_DUPLICATE_THRESHOLD), None)
+        if duplicate_of is None:
+            kept.append(i)
+            continue
+        entries[duplicate_of]["score"] += entries[i]["score"]
+        entries[duplicate_of]["providers"] += [p for p in entries[i]["providers"]
+                                               if p not in entries[duplicate_of]["providers"]]
+    kept.sort(key=lambda i: (-entries[i]["score"], -relevance[i]))
+
+    evidence = []
+    for i in kept[:limit]:
+        entry = entries[i]
+        evidence.append({
+            "title": entry["title"],
+            "url": entry["url"],
+            "snippet": entry["snippet"],
+            "providers": entry["providers"],
+            "score": round(entry["score"], 5)
+        })
+    return evidence
+
+
+def federated_search(question: str, providers: Sequence[str]) -> Tuple[List[dict], Dict[str, str]]:
+    """Query the providers concurrently and return the ranked evidence and any provider errors"""
+    with span("federated_search"):
+        results, errors = _query_providers(question, providers)
+        evidence = merge_results(question, results)
+    raw = sum(len(items) for items in results.values())
+    metrics.inc("federated_results_total", raw, stage="raw")
+    metrics.inc("federated_results_total", len(evidence), stage="evidence")
+    for name in errors:
+        metrics.inc("federated_provider_errors_total", 1, provider=name)
+    return evidence, errors
+
+
+def format_evidence(evidence: List[dict]) -> str:
+    """Numbered evidence list for the coordinator's prompt"""
+    return "\n".join(
+        f"[{number}] {entry['title']} — {entry['url'] or 'no URL'} ({', '.join(entry['providers'])})\n"
+        f"    {' '.join(entry['snippet'].split())}"
+        for number, entry in enumerate(evidence, 1)
+    )
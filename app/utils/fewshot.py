@@ -0,0 +1,90 @@
+import os
+import threading
+from functools import lru_cache
+from typing import Dict, List
+from app.utils.knn import knn_classifier
+from app.utils.prompts import get_classification_prompt, get_compact_classification_prompt
+from app.utils.tokens import count_tokens, encoding_available
+
+# "dynamic" sends a few nearest examples per category; "full" sends the whole example bank
+CLASSIFIER_PROMPT_MODE = os.getenv("CLASSIFIER_PROMPT_MODE", "dynamic").lower()
+FEW_SHOT_PER_CATEGORY = int(os.getenv("FEW_SHOT_PER_CATEGORY", "2"))
+
+
+@lru_cache(maxsize=1)
+def _prompt_tokens() -> tuple:
+    """Tokens in the full and the compact classifier prompt; both are fixed, so they are counted once"""
+    return count_tokens(get_classification_prompt()), count_tokens(get_compact_classification_prompt())
+
+
+def dynamic_prompt_enabled() -> bool:
+    return CLASSIFIER_PROMPT_MODE == "dynamic"
+
+
+def select_examples(questions: List[str], k: int = FEW_SHOT_PER_CATEGORY) -> Dict[str, List[str]]:
+    """Pick the k examples of each category closest to any of the questions"""
+    index = knn_classifier.index
+    # One matrix product scores every example against every question
+    queries = index.vectorizer.transform([str(question) for question in questions])
+    similarities = (index.matrix @ queries.T).max(axis=1)
+
+    selected = {}
+    for category in index.categories:
+        members = (index.labels == category).nonzero()[0]
+        best = members[(-similarities[members]).argsort()[:k]]
+        selected[category] = [index.texts[i] for i in best]
+    return selected
+
+
+def format_examples(examples: Dict[str, List[str]]) -> str:
+    lines = ["Examples:"]
+    for category, texts in examples.items():
+        lines.append(f"**{category}**")
+        lines.extend(f"- {text}" for text in texts)
+    return "\n".join(lines)
+
+
+class FewShotPromptBuilder:
+    """Builds compact classifier prompts and tracks the prompt tokens they save"""
+
+    def __init__(self, k: int = FEW_SHOT_PER_CATEGORY):
+        self.k = k
+        self._lock = threading.Lock()
+        self.prompts = 0
+        self.full_tokens = 0
+        self.dynamic_tokens = 0
+
+    def examples_block(self, questions: List[str]) -> str:
+        """Examples to append to a classification task, or "" when the full prompt is in use"""
+        if not dynamic_prompt_enabled():
+            return ""
+        block = format_examples(select_examples(questions, self.k))
+        report = self.token_report(block)
+        with self._lock:
+            self.prompts += 1
+            self.full_tokens += report["full"]
+            self.dynamic_tokens += report["dynamic"]
+        return block
+
+    @staticmethod
+    def token_report(examples_block: str) -> dict:
+        """Compare the full classifier prompt against the compact prompt plus selected examples"""
+        full, compact = _prompt_tokens()
+        dynamic = compact + count_tokens(examples_block)
+        return {"full": full, "dynamic": dynamic, "saved": full - dynamic}
+
+    def stats(self) -> dict:
+        """Return the mode and cumulative prompt tokens, before and after example selection"""
+        with self._lock:
+            return {
+                "mode": CLASSIFIER_PROMPT_MODE,
+                "examples_per_category": self.k,
+                "prompts": self.prompts,
+                "full_tokens": self.full_tokens,
+                "dynamic_tokens": self.dynamic_tokens,
+                "saved_tokens": self.full_tokens - self.dynamic_tokens,
+                "exact_counts": encoding_available()
+            }
+
+
+few_shot_prompts = FewShotPromptBuilder()
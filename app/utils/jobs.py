@@ -0,0 +1,220 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+from app.utils.classification import CLASSIFICATION_BATCH_SIZE, classify_many
+
+JOBS_DIR = os.getenv("JOBS_DIR", "uploads/jobs")
+# Rows classified between checkpoints; large enough to keep the worker pool busy
+JOB_CHECKPOINT_ROWS = int(os.getenv("JOB_CHECKPOINT_ROWS", "200"))
+# Job directories untouched for this many days are deleted when a new job is created; 0 keeps them forever
+JOB_RETENTION_DAYS = float(os.getenv("JOB_RETENTION_DAYS", "7"))
+
+ERROR_PREFIX = "Classification Error"
+
+# One run at a time per job, across Streamlit sessions in this process; run.lock extends it to other processes
+_job_locks: Dict[str, threading.Lock] = {}
+_job_locks_guard = threading.Lock()
+
+
+def _job_lock(job_id: str) -> threading.Lock:
+    with _job_locks_guard:
+        return _job_locks.setdefault(job_id, threading.Lock())
+
+
+@contextmanager
+def _holding_job(job_id: str, directory: str, blocking: bool = True) -> Iterator[bool]:
+    """Hold a job against other sessions and processes sharing uploads/; yields False if not blocking and busy"""
+    lock = _job_lock(job_id)
+    if not lock.acquire(blocking=blocking):
+        yield False
+        return
+    try:
+        with open(os.path.join(directory, "run.lock"), "a") as handle:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+    finally:
+        lock.release()
+
+
+def _write_json_atomic(path: str, data: dict):
+    # Write-then-rename so a crash never leaves a half-written checkpoint
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as handle:
+        json.dump(data, handle)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temporary, path)
+
+
+def prune_jobs(jobs_dir: str = JOBS_DIR, retention_days: float = JOB_RETENTION_DAYS) -> List[str]:
+    """Delete job directories not written to within the retention period and return their ids"""
+    if retention_days <= 0 or not os.path.isdir(jobs_dir):
+        return []
+    cutoff = time.time() - retention_days * 86400
+    pruned = []
+    for job_id in os.listdir(jobs_dir):
+        directory = os.path.join(jobs_dir, job_id)
+        if not os.path.isdir(directory):
+            continue
+        with _holding_job(job_id, directory, blocking=False) as held:
+            # A job being run right now, here or in another process, is never stale however old its files
+            if not held:
+                continue
+            paths = [os.path.join(directory, name) for name in os.listdir(directory)]
+            if max((os.path.getmtime(path) for path in paths), default=0) < cutoff:
+                shutil.rmtree(directory, ignore_errors=True)
+                pruned.append(job_id)
+    return pruned
+
+
+class ClassificationJob:
+    """A bulk classification persisted to disk row by row so it can resume after a restart.
+
+    The job directory holds the questions, an append-only results log and a
+    checkpoint summary. Jobs are addressed by the content of their questions,
+    so uploading the same sheet again picks up where the last run stopped.
+    Failed rows keep their error until reset_failed() queues them again.
+    """
+
+    def __init__(self, job_id: str, jobs_dir: str = JOBS_DIR):
+        self.job_id = job_id
+        self.directory = os.path.join(jobs_dir, job_id)
+        self.questions_path = os.path.join(self.directory, "questions.json")
+        self.results_path = os.path.join(self.directory, "results.jsonl")
+        self.checkpoint_path = os.path.join(self.directory, "checkpoint.json")
+        with open(self.questions_path, encoding="utf-8") as handle:
+            self.questions: List[str] = json.load(handle)
+        self._results = self._load_results()
+
+    @staticmethod
+    def job_id_for(questions: List[str]) -> str:
+        digest = hashlib.sha256()
+        for question in questions:
+            digest.update(str(question).encode("utf-8") + b"\0")
+        return digest.hexdigest()[:16]
+
+    @classmethod
+    def for_questions(cls, questions: List[str], jobs_dir: str = JOBS_DIR) -> "ClassificationJob":
+        """Open the job for these questions, creating it on first use"""
+        questions = [str(question) for question in questions]
+        job_id = cls.job_id_for(questions)
+        directory = os.path.join(jobs_dir, job_id)
+        questions_path = os.path.join(directory, "questions.json")
+        if not os.path.exists(questions_path):
+            prune_jobs(jobs_dir)
+            os.makedirs(directory, exist_ok=True)
+            _write_json_atomic(questions_path, questions)
+        return cls(job_id, jobs_dir)
+
+    def _load_results(self) -> Dict[int, str]:
+        results = {}
+        if os.path.exists(self.results_path):
+            with open(self.results_path, encoding="utf-8") as handle:
+                for line in handle:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn final line from a crash mid-write; that row is simply redone
+                        continue
+                    results[record["index"]] = record["category"]
+        return results
+
+    @staticmethod
+    def _write_records(handle, indices: List[int], categories: List[str]):
+        handle.writelines(
+            json.dumps({"index": index, "category": category}, ensure_ascii=False) + "\n"
+            for index, category in zip(indices, categories)
+        )
+        handle.flush()
+        os.fsync(handle.fileno())
+
+    def _append_results(self, indices: List[int], categories: List[str]):
+        with open(self.results_path, "a", encoding="utf-8") as handle:
+            self._write_records(handle, indices, categories)
+        self._results.update(zip(indices, categories))
+        self._write_checkpoint()
+
+    def _write_checkpoint(self):
+        _write_json_atomic(self.checkpoint_path, {
+            "job_id": self.job_id,
+            "total": len(self.questions),
+            "completed": self.completed,
+            "failed": len(self.failed_indices()),
+            "updated": time.time()
+        })
+
+    @property
+    def completed(self) -> int:
+        return sum(1 for category in self._results.values() if not category.startswith(ERROR_PREFIX))
+
+    @property
+    def done(self) -> bool:
+        return not self.pending_indices()
+
+    def failed_indices(self) -> List[int]:
+        return [index for index, category in self._results.items() if category.startswith(ERROR_PREFIX)]
+
+    def pending_indices(self) -> List[int]:
+        """Rows without a result yet"""
+        return [index for index in range(len(self.questions)) if index not in self._results]
+
+    def reset_failed(self) -> int:
+        """Drop the failed rows' results so the next run classifies only them again; returns how many"""
+        with _holding_job(self.job_id, self.directory):
+            self._results = self._load_results()
+            failed = set(self.failed_indices())
+            if failed:
+                kept = {index: category for index, category in self._results.items() if index not in failed}
+                # Rewrite-then-rename like the checkpoint, so a crash keeps either log whole
+                temporary = f"{self.results_path}.tmp"
+                with open(temporary, "w", encoding="utf-8") as handle:
+                    self._write_records(handle, list(kept), list(kept.values()))
+                os.replace(temporary, self.results_path)
+                self._results = kept
+                self._write_checkpoint()
+        return len(failed)
+
+    def run(self, batch_size: int = CLASSIFICATION_BATCH_SIZE,
+            on_progress: Optional[Callable[[int, int], None]] = None,
+            classify: Callable[..., List[str]] = classify_many) -> List[str]:
+        """Classify the pending rows, checkpointing every JOB_CHECKPOINT_ROWS rows"""
+        with _holding_job(self.job_id, self.directory):
+            # Another session or process may have advanced the job while we waited
+            self._results = self._load_results()
+            pending = self.pending_indices()
+            total = len(self.questions)
+            if on_progress:
+                on_progress(total - len(pending), total)
+
+            for start in range(0, len(pending), JOB_CHECKPOINT_ROWS):
+                indices = pending[start:start + JOB_CHECKPOINT_ROWS]
+                already = total - len(pending) + start
+
+                def on_batch(batches_done: int, batches: int, already=already, rows=len(indices)):
+                    # classify_many reports batches; the bar moves in rows across the whole job
+                    on_progress(already + min(batches_done * batch_size, rows), total)
+
+                categories = classify([self.questions[index] for index in indices], batch_size,
+                                      on_batch if on_progress else None)
+                self._append_results(indices, categories)
+                if on_progress:
+                    on_progress(total - len(pending) + start + len(indices), total)
+
+        return self.results()
+
+    def results(self) -> List[Optional[str]]:
+        """Categories in input order; None for rows not yet attempted"""
+        return [self._results.get(index) for index in range(len(self.questions))]
@@ -0,0 +1,88 @@
+import os
+import threading
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from app.utils.embeddings import HashedTfidfVectorizer
+from app.utils.prompts import get_classification_examples
+
+# Questions below this confidence fall through to the classifier agent
+KNN_CONFIDENCE_THRESHOLD = float(os.getenv("KNN_CONFIDENCE_THRESHOLD", "0.7"))
+KNN_NEIGHBOURS = int(os.getenv("KNN_NEIGHBOURS", "5"))
+
+
+class ExampleIndex:
+    """Vectorised index over the labelled example bank from the classification prompt"""
+
+    def __init__(self, examples: Optional[Dict[str, List[str]]] = None):
+        examples = examples or get_classification_examples()
+        self.texts = [text for texts in examples.values() for text in texts]
+        self.labels = np.array([category for category, texts in examples.items() for _ in texts])
+        self.categories = list(examples)
+        self.vectorizer = HashedTfidfVectorizer().fit(self.texts)
+        self.matrix = self.vectorizer.transform(self.texts)
+
+    def search(self, question: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the indices and cosine similarities of the k nearest examples"""
+        similarities = self.matrix @ self.vectorizer.embed(question)
+        k = min(k, len(similarities))
+        nearest = np.argpartition(-similarities, k - 1)[:k]
+        nearest = nearest[np.argsort(-similarities[nearest])]
+        return nearest, similarities[nearest]
+
+
+class KNNClassifier:
+    """Similarity-weighted k-nearest-neighbour classifier over the example bank"""
+
+    def __init__(self, index: Optional[ExampleIndex] = None, k: int = KNN_NEIGHBOURS,
+                 threshold: float = KNN_CONFIDENCE_THRESHOLD):
+        self._index = index
+        self._index_lock = threading.Lock()
+        self.k = k
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.evaluated = 0
+        self.short_circuited = 0
+
+    @property
+    def index(self) -> ExampleIndex:
+        # Built lazily so importing the module stays cheap
+        if self._index is None:
+            with self._index_lock:
+                if self._index is None:
+                    self._index = ExampleIndex()
+        return self._index
+
+    def predict(self, question: str) -> Tuple[str, float]:
+        """Return the most likely category and a confidence score between 0 and 1"""
+        nearest, similarities = self.index.search(question, self.k)
+        weights = np.clip(similarities, 0.0, None)
+        total = float(weights.sum())
+        if total == 0.0:
+            return self.index.labels[nearest[0]], 0.0
+
+        labels = self.index.labels[nearest]
+        scores = {label: float(weights[labels == label].sum()) for label in set(labels)}
+        category = max(scores, key=scores.get)
+        # Vote share, damped when even the closest example is only loosely related
+        confidence = scores[category] / total * min(1.0, float(similarities[0]) / 0.3)
+        return str(category), confidence
+
+    def classify(self, question: str) -> Optional[str]:
+        """Return the category when the prediction clears the confidence threshold"""
+        category, confidence = self.predict(question)
+        decided = confidence >= self.threshold
+
+        with self._lock:
+            self.evaluated += 1
+            if decided:
+                self.short_circuited += 1
+
+        return category if decided else None
+
+    def stats(self) -> dict:
+        """Return how many questions were evaluated and decided locally"""
+        with self._lock:
+            return {"evaluated": self.evaluated, "short_circuited": self.short_circuited}
+
+
+knn_classifier = KNNClassifier()
@@ -0,0 +1,330 @@
+import contextvars
+import copy
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple, Union
+import numpy as np
+from crewai.llms.base_llm import BaseLLM
+from crewai.utilities.events import crewai_event_bus
+from crewai.utilities.events.llm_events import LLMStreamChunkEvent
+from app.utils.event_log import event_log
+from app.utils.metrics import metrics, model_name
+
+# Route agent LLM calls across providers with hedging and failover; off means every agent uses OpenAI directly
+LLM_ROUTING = os.getenv("LLM_ROUTING", "true").lower() in ("1", "true", "yes")
+# Providers per agent in order of preference, as "provider" or "provider:model";
+# LLM_PREFERENCES='{"classifier": ["groq", "openai"]}' overrides. Providers without an API key are skipped
+LLM_PREFERENCES: Dict[str, List[str]] = {
+    "classifier": ["openai", "groq"],
+    "duckduckgo": ["openai", "groq"],
+    "tavily": ["openai", "groq"],
+    "coordinator": ["openai", "groq"],
+    **json.loads(os.getenv("LLM_PREFERENCES", "{}"))
+}
+# Recent successful call times kept per agent and provider
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "50"))
+LLM_LATENCY_MIN_SAMPLES = int(os.getenv("LLM_LATENCY_MIN_SAMPLES", "5"))
+# A less preferred provider goes first once the preferred one's median is this many times slower
+LLM_LATENCY_SWITCH_RATIO = float(os.getenv("LLM_LATENCY_SWITCH_RATIO", "2.0"))
+# The next provider is fired when the first has not answered by this quantile of its recent call times
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "90"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))
+# Also the delay while a provider has too few samples for the quantile
+LLM_HEDGE_MAX_DELAY = float(os.getenv("LLM_HEDGE_MAX_DELAY", "20.0"))
+# Consecutive failures that open a provider's circuit, and how long it stays out of rotation
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+
+# Calls run here so the caller can wait on the first provider with a timeout
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_HEDGE_MAX_WORKERS", "32")),
+                               thread_name_prefix="llm-hedge")
+
+
+# Provider LLM -> chunks it has streamed during the current call
+_streamed_chunks = weakref.WeakKeyDictionary()
+_streamed_lock = threading.Lock()
+
+
+@crewai_event_bus.on(LLMStreamChunkEvent)
+def _count_stream_chunk(source, event: LLMStreamChunkEvent):
+    with _streamed_lock:
+        if source is not None and source in _streamed_chunks:
+            _streamed_chunks[source] += 1
+
+
+class ProvidersUnavailable(RuntimeError):
+    """Every provider an agent may use has its circuit open"""
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures; after the cooldown a single trial call decides whether it closes"""
+
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN_SECONDS):
+        self.threshold = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+
+    def is_open(self, now: float) -> bool:
+        return self.state == "open" and now - self.opened_at < self.cooldown
+
+    def allow(self, now: float) -> bool:
+        """Whether a call may go to the provider; claims the trial call when the cooldown is over"""
+        if self.state == "closed":
+            return True
+        if self.state == "open" and now - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+            return True
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self, now: float) -> bool:
+        """Count a failure and return True when it opens the circuit"""
+        self.failures += 1
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.threshold):
+            self.state = "open"
+            self.opened_at = now
+            self.trips += 1
+            return True
+        return False
+
+
+class ProviderRouter:
+    """Latency windows per agent and provider and a circuit breaker per provider.
+
+    Providers are tried in the agent's order of preference, except that a much
+    faster one is moved to the front, and the hedge delay for a provider is the
+    configured quantile of its recent call times for that agent.
+    """
+
+    def __init__(self, preferences: Dict[str, List[str]] = LLM_PREFERENCES, enabled: bool = LLM_ROUTING):
+        self.preferences = preferences
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._windows: Dict[Tuple[str, str], deque] = defaultdict(lambda: deque(maxlen=LLM_LATENCY_WINDOW))
+        self._breakers: Dict[str, CircuitBreaker] = defaultdict(CircuitBreaker)
+        self._counts: Dict[Tuple[str, str], Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def candidates(self, agent: str) -> List[Tuple[str, Optional[str]]]:
+        """(provider, model or None for the provider's default) in the agent's order of preference"""
+        specs = self.preferences.get(agent, ["openai"])
+        return [(spec.split(":", 1)[0], spec.split(":", 1)[1] if ":" in spec else None) for spec in specs]
+
+    def _quantile(self, agent: str, provider: str, q: float) -> Optional[float]:
+        window = self._windows.get((agent, provider))
+        if not window or len(window) < LLM_LATENCY_MIN_SAMPLES:
+            return None
+        return float(np.percentile(window, q))
+
+    def order(self, agent: str, providers: List[str]) -> List[str]:
+        """Providers to try for a call, closed circuits only, the preferred or much faster one first"""
+        now = time.monotonic()
+        with self._lock:
+            available = [provider for provider in providers if not self._breakers[provider].is_open(now)]
+            medians = {provider: self._quantile(agent, provider, 50) for provider in available}
+        if not available:
+            raise ProvidersUnavailable(f"No LLM provider available for {agent}: {', '.join(providers)} circuits open")
+        timed = [provider for provider in available if medians[provider] is not None]
+        if timed and medians[available[0]] is not None:
+            fastest = min(timed, key=medians.get)
+            if medians[available[0]] > LLM_LATENCY_SWITCH_RATIO * medians[fastest]:
+                available.remove(fastest)
+                available.insert(0, fastest)
+        return available
+
+    def hedge_delay(self, agent: str, provider: str) -> float:
+        with self._lock:
+            delay = self._quantile(agent, provider, LLM_HEDGE_QUANTILE)
+        return LLM_HEDGE_MAX_DELAY if delay is None else min(max(delay, LLM_HEDGE_MIN_DELAY), LLM_HEDGE_MAX_DELAY)
+
+    def acquire(self, provider: str) -> bool:
+        with self._lock:
+            return self._breakers[provider].allow(time.monotonic())
+
+    def record(self, agent: str, provider: str, seconds: float, error: Optional[Exception] = None):
+        """Account a finished call; failures count towards the provider's circuit breaker"""
+        with self._lock:
+            counts = self._counts[(agent, provider)]
+            breaker = self._breakers[provider]
+            if error is None:
+                self._windows[(agent, provider)].append(seconds)
+                counts["ok"] += 1
+                breaker.record_success()
+                opened = False
+            else:
+                counts["errors"] += 1
+                opened = breaker.record_failure(time.monotonic())
+        metrics.inc("llm_provider_calls_total", agent=agent, provider=provider, outcome="ok" if error is None else "error")
+        if opened:
+            metrics.inc("llm_circuit_opened_total", provider=provider)
+            event_log.emit("llm_circuit_opened", logging.WARNING, provider=provider, error=str(error),
+                           cooldown_seconds=breaker.cooldown)
+
+    def count(self, agent: str, provider: str, event: str):
+        """Count a hedge, a hedge win or a failover against the provider it went to"""
+        with self._lock:
+            self._counts[(agent, provider)][event] += 1
+        metrics.inc(f"llm_{event}_total", agent=agent, provider=provider)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            agents = defaultdict(dict)
+            for (agent, provider), counts in sorted(self._counts.items()):
+                agents[agent][provider] = {
+                    **counts,
+                    "p50_seconds": self._quantile(agent, provider, 50),
+                    f"p{LLM_HEDGE_QUANTILE:g}_seconds": self._quantile(agent, provider, LLM_HEDGE_QUANTILE)
+                }
+            providers = {
+                provider: {
+                    "state": "open" if breaker.is_open(now) else breaker.state,
+                    "consecutive_failures": breaker.failures,
+                    "trips": breaker.trips
+                }
+                for provider, breaker in sorted(self._breakers.items())
+            }
+        return {"enabled": self.enabled, "providers": providers, "agents": dict(agents)}
+
+
+llm_router = ProviderRouter()
+
+
+class HedgedLLM(BaseLLM):
+    """CrewAI LLM that sends each call to one of an agent's providers and hedges slow ones.
+
+    The first provider gets the call; if it has not answered within its hedge
+    delay the next one is fired too, and the first answer wins. A failed call
+    moves on to the next provider straight away. Streaming calls are never
+    hedged, since two providers would interleave their tokens, and only fail
+    over while the failed provider has not streamed anything yet; after that
+    a second answer would repeat the first one's tokens, so the error is raised.
+    """
+
+    def __init__(self, agent: str, candidates: Dict[str, BaseLLM], router: ProviderRouter = llm_router):
+        primary = next(iter(candidates.values()))
+        super().__init__(model=primary.model, temperature=primary.temperature)
+        self.agent = agent
+        self.candidates = candidates
+        self.router = router
+        self._stream = False
+        # Calls each provider completed; CrewAI counts their tokens into one total per agent
+        self.completed_calls: Dict[str, int] = defaultdict(int)
+        self._calls_lock = threading.Lock()
+
+    @property
+    def stream(self) -> bool:
+        return self._stream
+
+    @stream.setter
+    def stream(self, value: bool):
+        self._stream = value
+        for llm in self.candidates.values():
+            llm.stream = value
+
+    def __copy__(self) -> "HedgedLLM":
+        # Agent copies get their own provider clients, so per-request event bindings stay apart
+        clone = HedgedLLM(self.agent, {name: copy.copy(llm) for name, llm in self.candidates.items()}, self.router)
+        clone.stop = list(self.stop or [])
+        clone.stream = self.stream
+        return clone
+
+    def _call_provider(self, provider: str, *args) -> Any:
+        llm = self.candidates[provider]
+        llm.stop = self.stop
+        if self.stream:
+            with _streamed_lock:
+                _streamed_chunks[llm] = 0
+        start = time.perf_counter()
+        try:
+            response = llm.call(*args)
+        except Exception as e:
+            self.router.record(self.agent, provider, time.perf_counter() - start, e)
+            raise
+        self.router.record(self.agent, provider, time.perf_counter() - start)
+        with self._calls_lock:
+            self.completed_calls[provider] += 1
+        return response
+
+    def model_shares(self) -> Dict[str, float]:
+        """Share of completed calls per provider model, for pricing the agent's token total"""
+        with self._calls_lock:
+            calls = dict(self.completed_calls)
+        total = sum(calls.values())
+        shares: Dict[str, float] = defaultdict(float)
+        for provider, count in calls.items():
+            if count:
+                shares[model_name(self.candidates[provider])] += count / total
+        return dict(shares)
+
+    def _streamed(self, provider: str) -> int:
+        with _streamed_lock:
+            return _streamed_chunks.get(self.candidates[provider], 0)
+
+    def call(self, messages: Union[str, List[Dict[str, str]]], tools: Optional[List[dict]] = None,
+             callbacks: Optional[List[Any]] = None,
+             available_functions: Optional[Dict[str, Any]] = None) -> Union[str, Any]:
+        queue = self.router.order(self.agent, list(self.candidates))
+        args = (messages, tools, callbacks, available_functions)
+        # Future -> (provider, why it was called: None for the first call, "hedges" or "failovers")
+        running: Dict[Future, Tuple[str, Optional[str]]] = {}
+        errors: List[Exception] = []
+
+        def launch(reason: Optional[str]) -> Optional[str]:
+            while queue:
+                provider = queue.pop(0)
+                if not self.router.acquire(provider):
+                    continue
+                if reason:
+                    self.router.count(self.agent, provider, reason)
+                # Threads start from a copy of the caller's context so its request trace is visible
+                future = _executor.submit(contextvars.copy_context().run, self._call_provider, provider, *args)
+                running[future] = (provider, reason)
+                return provider
+            return None
+
+        if launch(None) is None:
+            raise ProvidersUnavailable(f"No LLM provider available for {self.agent}")
+        while running:
+            latest, _ = list(running.values())[-1]
+            hedge = bool(queue) and not self.stream
+            done, _ = wait(running, timeout=self.router.hedge_delay(self.agent, latest) if hedge else None,
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                hedged_to = launch("hedges")
+                if hedged_to is not None:
+                    event_log.emit("llm_hedge_fired", logging.DEBUG, agent=self.agent, waiting_on=latest,
+                                   hedged_to=hedged_to)
+                continue
+            for future in done:
+                provider, reason = running.pop(future)
+                if future.exception() is None:
+                    if reason == "hedges":
+                        self.router.count(self.agent, provider, "hedge_wins")
+                    return future.result()
+                errors.append(future.exception())
+                if self.stream and self._streamed(provider):
+                    event_log.emit("llm_stream_interrupted", logging.WARNING, agent=self.agent, provider=provider,
+                                   error=str(future.exception()))
+                    raise future.exception()
+            # A failure moves on to the next provider unless another call is still running
+            if not running:
+                launch("failovers")
+        raise errors[-1]
+
+    def supports_stop_words(self) -> bool:
+        return all(llm.supports_stop_words() for llm in self.candidates.values())
+
+    def get_context_window_size(self) -> int:
+        return min(llm.get_context_window_size() for llm in self.candidates.values())
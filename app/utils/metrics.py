@@ -0,0 +1,363 @@
+import json
+import os
+import threading
+import time
+import uuid
+import weakref
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Tuple
+import numpy as np
+from crewai.utilities.events import crewai_event_bus
+from crewai.utilities.events.llm_events import LLMCallCompletedEvent, LLMCallFailedEvent, LLMCallStartedEvent
+from crewai.utilities.events.tool_usage_events import ToolUsageFinishedEvent
+
+METRICS_PREFIX = "question_prism"
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Recent observations kept per series for the p50/p95/p99 in the JSON snapshot
+METRICS_QUANTILE_WINDOW = int(os.getenv("METRICS_QUANTILE_WINDOW", "1024"))
+MAX_TRACE_SPANS = 500
+
+# USD per million (prompt, completion) tokens; MODEL_PRICES='{"model": [in, out]}' overrides
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+    **{model: tuple(price) for model, price in json.loads(os.getenv("MODEL_PRICES", "{}")).items()}
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def model_name(llm) -> str:
+    """Model name without a provider prefix such as "groq/" """
+    return str(getattr(llm, "model", None) or getattr(llm, "model_name", "unknown")).split("/")[-1]
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+class Histogram:
+    """Cumulative Prometheus buckets plus a window of recent values for quantiles"""
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=METRICS_QUANTILE_WINDOW)
+
+    def observe(self, value: float):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def summary(self) -> dict:
+        p50, p95, p99 = np.percentile(self.recent, [50, 95, 99]) if self.recent else (None, None, None)
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": None if p50 is None else float(p50),
+            "p95": None if p95 is None else float(p95),
+            "p99": None if p99 is None else float(p99)
+        }
+
+
+class MetricsRegistry:
+    """Process-wide latency histograms and counters with Prometheus and JSON export"""
+
+    HELP = {
+        "stage_duration_seconds": "Time spent in each pipeline stage",
+        "llm_call_duration_seconds": "Time per LLM call, by agent and model",
+        "tool_duration_seconds": "Time per agent tool call",
+        "stage_errors_total": "Stages that raised an exception",
+        "tokens_total": "LLM tokens used, by agent, model and kind",
+        "cost_usd_total": "Estimated LLM spend in US dollars"
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = defaultdict(dict)
+        self.counters: Dict[str, Dict[Labels, float]] = defaultdict(lambda: defaultdict(float))
+
+    def observe(self, name: str, value: float, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self.histograms[name]
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        with self._lock:
+            self.counters[name][_labels(labels)] += value
+
+    def prometheus(self) -> str:
+        """Render every series in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.histograms.items()):
+                metric = f"{METRICS_PREFIX}_{name}"
+                lines += [f"# HELP {metric} {self.HELP.get(name, name)}", f"# TYPE {metric} histogram"]
+                for labels, histogram in sorted(series.items()):
+                    for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+                        lines.append(f"{metric}_bucket{_format_labels(labels, (('le', str(bound)),))} {count}")
+                    lines.append(f"{metric}_bucket{_format_labels(labels, (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{metric}_sum{_format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{metric}_count{_format_labels(labels)} {histogram.count}")
+            for name, series in sorted(self.counters.items()):
+                metric = f"{METRICS_PREFIX}_{name}"
+                lines += [f"# HELP {metric} {self.HELP.get(name, name)}", f"# TYPE {metric} counter"]
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{metric}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """Return every series as JSON, with p50/p95/p99 over the recent window"""
+        with self._lock:
+            return {
+                "histograms": {
+                    name: [{"labels": dict(labels), **histogram.summary()} for labels, histogram in series.items()]
+                    for name, series in self.histograms.items()
+                },
+                "counters": {
+                    name: [{"labels": dict(labels), "value": value} for labels, value in series.items()]
+                    for name, series in self.counters.items()
+                }
+            }
+
+    def clear(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+
+class RequestTrace:
+    """Spans and token usage of one request, exported as a JSON document"""
+
+    def __init__(self, kind: str, **attributes):
+        self.id = uuid.uuid4().hex[:16]
+        self.kind = kind
+        self.attributes = attributes
+        self.started_at = time.time()
+        self.seconds: Optional[float] = None
+        self.spans = []
+        self.dropped_spans = 0
+        self.usage: Dict[str, dict] = {}
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def add_span(self, stage: str, seconds: float, **labels):
+        with self._lock:
+            if len(self.spans) >= MAX_TRACE_SPANS:
+                self.dropped_spans += 1
+                return
+            self.spans.append({
+                "stage": stage,
+                "start": time.time() - seconds - self.started_at,
+                "seconds": seconds,
+                **labels
+            })
+
+    def accumulate(self, attribute: str, **values: float):
+        """Add numeric values into a dict attribute, e.g. per-request token savings"""
+        with self._lock:
+            # A fresh dict each time, so documents already exported by to_dict() do not change
+            totals = dict(self.attributes.get(attribute, {}))
+            for key, value in values.items():
+                totals[key] = totals.get(key, 0) + value
+            self.attributes[attribute] = totals
+
+    def add_usage(self, agent: str, model: str, prompt_tokens: int, completion_tokens: int, cost: float):
+        with self._lock:
+            usage = self.usage.setdefault(agent, {
+                "model": model, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0
+            })
+            usage["prompt_tokens"] += prompt_tokens
+            usage["completion_tokens"] += completion_tokens
+            usage["cost_usd"] += cost
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                **self.attributes,
+                "started_at": self.started_at,
+                "seconds": self.seconds,
+                "error": self.error,
+                "spans": list(self.spans),
+                "dropped_spans": self.dropped_spans,
+                "usage": {agent: dict(usage) for agent, usage in self.usage.items()},
+                "prompt_tokens": sum(usage["prompt_tokens"] for usage in self.usage.values()),
+                "completion_tokens": sum(usage["completion_tokens"] for usage in self.usage.values()),
+                "cost_usd": sum(usage["cost_usd"] for usage in self.usage.values())
+            }
+
+
+metrics = MetricsRegistry()
+recent_traces = deque(maxlen=100)
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+# CrewAI LLM instance -> (agent role, trace); LLM events carry only the LLM as their source
+_bound_llms = weakref.WeakKeyDictionary()
+_bound_lock = threading.Lock()
+# CrewAI LLM instance -> {thread id: call start}; weak, so a call that dies without an end event leaves nothing behind
+_call_starts = weakref.WeakKeyDictionary()
+_call_starts_lock = threading.Lock()
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(stage: str, attach: bool = True, **labels) -> Iterator[None]:
+    """Time a block into the stage histogram and, when attach is set, the current request trace"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        metrics.inc("stage_errors_total", stage=stage)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        metrics.observe("stage_duration_seconds", seconds, stage=stage, **labels)
+        trace = _current_trace.get()
+        if attach and trace is not None:
+            trace.add_span(stage, seconds, **labels)
+
+
+def _write_trace(trace: dict):
+    # event_log imports this module, so its queue-backed writer is looked up on first use
+    from app.utils.event_log import trace_log
+
+    trace_log.write(trace)
+
+
+@contextmanager
+def request_trace(kind: str, **attributes) -> Iterator[RequestTrace]:
+    """Collect the spans of everything run inside the block into one per-request trace"""
+    trace = RequestTrace(kind, **attributes)
+    token = _current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        yield trace
+    except Exception as e:
+        trace.error = str(e)
+        raise
+    finally:
+        _current_trace.reset(token)
+        trace.seconds = time.perf_counter() - start
+        metrics.observe("stage_duration_seconds", trace.seconds, stage=kind)
+        document = trace.to_dict()
+        recent_traces.append(document)
+        _write_trace(document)
+
+
+def bind_agents(agents, trace: Optional[RequestTrace] = None):
+    """Attribute LLM and tool events from these agents to their role and the current trace"""
+    trace = trace or _current_trace.get()
+    with _bound_lock:
+        for agent in agents:
+            if getattr(agent, "llm", None) is not None:
+                # Provider-routed LLMs raise their events from the provider clients behind them
+                for llm in (agent.llm, *getattr(agent.llm, "candidates", {}).values()):
+                    _bound_llms[llm] = (agent.role, trace)
+
+
+def llm_binding(llm) -> Tuple[str, Optional[RequestTrace]]:
+    """Agent role and request trace an LLM instance was bound to"""
+    with _bound_lock:
+        return _bound_llms.get(llm, ("unknown", None)) if llm is not None else ("unknown", None)
+
+
+def record_usage(agent: str, model: str, prompt_tokens: int, completion_tokens: int,
+                 trace: Optional[RequestTrace] = None):
+    cost = estimate_cost(model, prompt_tokens, completion_tokens)
+    metrics.inc("tokens_total", prompt_tokens, agent=agent, model=model, kind="prompt")
+    metrics.inc("tokens_total", completion_tokens, agent=agent, model=model, kind="completion")
+    metrics.inc("cost_usd_total", cost, agent=agent, model=model)
+    trace = trace or _current_trace.get()
+    if trace is not None:
+        trace.add_usage(agent, model, prompt_tokens, completion_tokens, cost)
+
+
+def record_crew_usage(crew, trace: Optional[RequestTrace] = None):
+    """Record the token usage of each agent after a crew kickoff.
+
+    CrewAI reports one token total per agent; for a provider-routed LLM it is
+    split across the providers' models by the share of calls each completed.
+    """
+    for agent in crew.agents:
+        summary = agent._token_process.get_summary()
+        if not summary.total_tokens:
+            continue
+        shares = getattr(agent.llm, "model_shares", dict)() or {model_name(agent.llm): 1.0}
+        prompt_left, completion_left = summary.prompt_tokens, summary.completion_tokens
+        for position, (model, share) in enumerate(shares.items(), 1):
+            # The last model takes the rounding remainder so the totals still add up
+            last = position == len(shares)
+            prompt = prompt_left if last else round(summary.prompt_tokens * share)
+            completion = completion_left if last else round(summary.completion_tokens * share)
+            prompt_left -= prompt
+            completion_left -= completion
+            record_usage(agent.role, model, prompt, completion, trace)
+
+
+@crewai_event_bus.on(LLMCallStartedEvent)
+def _on_llm_call_started(source, event: LLMCallStartedEvent):
+    # Handlers run synchronously in the calling thread, so (llm, thread) pairs start and end
+    with _call_starts_lock:
+        _call_starts.setdefault(source, {})[threading.get_ident()] = time.perf_counter()
+
+
+def _finish_llm_call(source, outcome: str):
+    with _call_starts_lock:
+        start = _call_starts.get(source, {}).pop(threading.get_ident(), None)
+    if start is None:
+        return
+    seconds = time.perf_counter() - start
+    agent, trace = llm_binding(source)
+    model = model_name(source)
+    metrics.observe("llm_call_duration_seconds", seconds, agent=agent, model=model, outcome=outcome)
+    if trace is not None:
+        trace.add_span("llm_call", seconds, agent=agent, model=model, outcome=outcome)
+
+
+@crewai_event_bus.on(LLMCallCompletedEvent)
+def _on_llm_call_completed(source, event: LLMCallCompletedEvent):
+    _finish_llm_call(source, "ok")
+
+
+@crewai_event_bus.on(LLMCallFailedEvent)
+def _on_llm_call_failed(source, event: LLMCallFailedEvent):
+    _finish_llm_call(source, "error")
+
+
+@crewai_event_bus.on(ToolUsageFinishedEvent)
+def _on_tool_usage_finished(source, event: ToolUsageFinishedEvent):
+    seconds = (event.finished_at - event.started_at).total_seconds()
+    # The event usually leaves agent unset; the emitting ToolUsage carries it
+    agent, trace = llm_binding(getattr(event.agent or getattr(source, "agent", None), "llm", None))
+    labels = {"tool": event.tool_name, "from_cache": str(event.from_cache).lower()}
+    metrics.observe("tool_duration_seconds", seconds, **labels)
+    if trace is not None:
+        trace.add_span("tool", seconds, agent=agent, **labels)
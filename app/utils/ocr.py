@@ -1,20 +1,206 @@
-import easyocr
 import asyncio
+import os
+import re
+import time
+import numpy as np
 from io import BytesIO
-from PIL import Image
+from typing import AsyncGenerator, Iterator, List
+from PIL import Image, ImageOps, ImageSequence
+from app.utils.cache import OCRCache, fingerprint
+from app.utils.metrics import metrics, span
+from app.utils.registry import registry
 
-# Initialize EasyOCR with English ('en') and Hindi ('hi')
+# EasyOCR reads English ('en') and Hindi ('hi')
 SUPPORTED_LANGUAGES = ['en', 'hi']
-reader = easyocr.Reader(SUPPORTED_LANGUAGES)
 
 
-async def extract_text_from_image(image_bytes: bytes) -> str:
+def _build_reader():
+    # Imported here so hosts without EasyOCR can still run with a registered stand-in reader
+    import easyocr
+
+    return easyocr.Reader(SUPPORTED_LANGUAGES)
+
+
+def get_reader():
+    """The process-wide EasyOCR reader, loaded on first use"""
+    return registry.get_or_create(("ocr", "reader"), _build_reader)
+
+
+# Preprocessing settings; text stays legible well below phone-camera resolutions
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "1600"))
+OCR_GRAYSCALE = os.getenv("OCR_GRAYSCALE", "true").lower() in ("1", "true", "yes")
+OCR_DESKEW = os.getenv("OCR_DESKEW", "true").lower() in ("1", "true", "yes")
+OCR_PDF_DPI = int(os.getenv("OCR_PDF_DPI", "200"))
+
+# Results are reused for identical bytes as long as the languages and settings match
+ocr_cache = OCRCache(fingerprint(
+    ",".join(SUPPORTED_LANGUAGES),
+    str(OCR_MAX_SIDE),
+    str(OCR_GRAYSCALE),
+    str(OCR_DESKEW),
+    str(OCR_PDF_DPI)
+))
+
+# Question numbering such as "1.", "2)" or "Q3." followed by a capitalised sentence
+QUESTION_MARKER = re.compile(r"(?:^|(?<=\s))(?:Q\.?\s*)?\d{1,3}[.)]\s+(?=[A-Z])")
+
+
+def estimate_skew(image: Image.Image, max_angle: float = 5.0, step: float = 0.5) -> float:
+    """Estimate the text skew angle from the sharpness of the horizontal projection profile"""
+    sample = image.convert("L")
+    sample.thumbnail((400, 400))
+    # Dark text on light background becomes 1s, so row sums peak on text lines
+    ink = ImageOps.invert(ImageOps.autocontrast(sample))
+
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_angle, max_angle + step, step):
+        rotated = np.asarray(ink.rotate(float(angle), resample=Image.BILINEAR), dtype=np.float32)
+        score = float(np.var(rotated.sum(axis=1)))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def preprocess_image(image: Image.Image, max_side: int = OCR_MAX_SIDE,
+                     grayscale: bool = OCR_GRAYSCALE, deskew: bool = OCR_DESKEW) -> np.ndarray:
+    """Normalise orientation, resolution and colour before OCR"""
+    # Phone photos are often stored sideways with an EXIF rotation flag
+    image = ImageOps.exif_transpose(image)
+    if grayscale:
+        image = ImageOps.autocontrast(image.convert("L"))
+    else:
+        image = image.convert("RGB")
+
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    if deskew:
+        angle = estimate_skew(image)
+        if angle:
+            fill = 255 if image.mode == "L" else (255, 255, 255)
+            image = image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=fill)
+
+    return np.asarray(image)
+
+
+def split_questions(text: str) -> List[str]:
+    """Split page text into numbered questions, or keep it whole when there is no numbering"""
+    starts = [match.start() for match in QUESTION_MARKER.finditer(text)]
+    if len(starts) < 2:
+        return [text.strip()] if text.strip() else []
+    segments = [text[start:end] for start, end in zip(starts, starts[1:] + [len(text)])]
+    return [QUESTION_MARKER.sub("", segment, count=1).strip() for segment in segments if segment.strip()]
+
+
+def iter_document_pages(file_bytes: bytes, start: int = 1) -> Iterator[Image.Image]:
+    """Yield each page of a PDF, or each frame of a (multi-page) image such as TIFF, from page start on"""
+    if file_bytes[:4] == b"%PDF":
+        import pypdfium2
+
+        document = pypdfium2.PdfDocument(file_bytes)
+        try:
+            for index in range(start - 1, len(document)):
+                yield document[index].render(scale=OCR_PDF_DPI / 72).to_pil()
+        finally:
+            document.close()
+    else:
+        with Image.open(BytesIO(file_bytes)) as image:
+            for index in range(start - 1, getattr(image, "n_frames", 1)):
+                image.seek(index)
+                yield image.copy()
+
+
+def ocr_image(image: Image.Image, preprocess: bool = True) -> dict:
+    """Run OCR on one image and report per-stage timings in seconds"""
+    start = time.perf_counter()
+    pixels = preprocess_image(image) if preprocess else np.asarray(image.convert("RGB"))
+    preprocessed = time.perf_counter()
+    result = get_reader().readtext(pixels)
+    finished = time.perf_counter()
+    metrics.observe("stage_duration_seconds", preprocessed - start, stage="ocr_preprocess")
+    metrics.observe("stage_duration_seconds", finished - preprocessed, stage="ocr_recognition")
+
+    return {
+        "text": " ".join([text[1] for text in result]),
+        "timings": {
+            "preprocess": preprocessed - start,
+            "ocr": finished - preprocessed,
+            "total": finished - start
+        }
+    }
+
+
+def ocr_page(digest: str, number: int, page: Image.Image, preprocess: bool = True) -> dict:
+    """OCR one document page, reusing the cached result for the same document"""
+    page_result = ocr_cache.get(digest, number, preprocess)
+    if page_result is not None:
+        page_result["cached"] = True
+        return page_result
+
+    page_result = ocr_image(page, preprocess)
+    page_result["page"] = number
+    page_result["questions"] = split_questions(page_result["text"])
+    ocr_cache.set(digest, page_result, number, preprocess)
+    page_result["cached"] = False
+    return page_result
+
+
+def ocr_document(file_bytes: bytes, preprocess: bool = True) -> Iterator[dict]:
+    """Stream pages through OCR, yielding the text, questions and timings of each page.
+
+    Pages already in the cache are served without decoding or rendering the
+    document; it is only opened from the first page that misses.
+    """
+    digest = ocr_cache.digest(file_bytes)
+    pages = ocr_cache.get_page_count(digest)
+    number = 1
+    while pages is not None and number <= pages:
+        page_result = ocr_cache.get(digest, number, preprocess)
+        if page_result is None:
+            break
+        page_result["cached"] = True
+        yield page_result
+        number += 1
+    if pages is not None and number > pages:
+        return
+
+    last = number - 1
+    for last, page in enumerate(iter_document_pages(file_bytes, number), number):
+        yield ocr_page(digest, last, page, preprocess)
+    ocr_cache.set_page_count(digest, last)
+
+
+async def extract_text_from_image(image_bytes: bytes, preprocess: bool = True) -> str:
+    with span("ocr"):
+        return await _extract_text_from_image(image_bytes, preprocess)
+
+
+async def _extract_text_from_image(image_bytes: bytes, preprocess: bool) -> str:
+    digest = ocr_cache.digest(image_bytes)
+    cached = ocr_cache.get(digest, preprocess=preprocess)
+    if cached is not None:
+        return cached["text"]
+
     loop = asyncio.get_event_loop()
 
-    # Pass raw bytes directly to EasyOCR
-    result = await loop.run_in_executor(None, reader.readtext, image_bytes)
+    if not preprocess:
+        # Pass raw bytes directly to EasyOCR
+        result = await loop.run_in_executor(None, get_reader().readtext, image_bytes)
+        extracted_text = " ".join([text[1] for text in result])
+    else:
+        image = Image.open(BytesIO(image_bytes))
+        extracted_text = (await loop.run_in_executor(None, ocr_image, image, preprocess))["text"]
 
-    extracted_text = " ".join([text[1] for text in result])
+    ocr_cache.set(digest, {"text": extracted_text}, preprocess=preprocess)
     return extracted_text
 
 
+async def extract_pages_from_document(file_bytes: bytes, preprocess: bool = True) -> AsyncGenerator[dict, None]:
+    """Async variant of ocr_document that runs each page off the event loop"""
+    loop = asyncio.get_event_loop()
+    pages = ocr_document(file_bytes, preprocess)
+    while True:
+        page_result = await loop.run_in_executor(None, next, pages, None)
+        if page_result is None:
+            break
+        yield page_result
@@ -1,3 +1,5 @@
+import re
+
 def get_classification_prompt():
     return """
 You are a question classification agent that analyzes user questions and strictly classifies them into only one of the following categories:
@@ -193,6 +195,37 @@ Examples:
 20. Astronomers studying exoplanets have discovered that rocky planets in the "habitable zone" around their stars are more likely to retain atmospheres and liquid water if they have strong magnetic fields. Earth's magnetic field protects our atmosphere from being stripped away by solar wind. Planets without magnetic fields, even those at appropriate distances from their stars, tend to lose their atmospheres over time. This knowledge indicates that the search for life beyond Earth should focus on planets that ______ Which choice most logically completes the text?
 """
 
+CLASSIFICATION_CATEGORIES = [
+    "Mathematical",
+    "Definition",
+    "Formulation",
+    "Inferential",
+    "Differentiation",
+    "Analytical",
+    "Statistical",
+    "Inference"
+]
+
+def get_compact_classification_prompt():
+    """The classification prompt without its example bank"""
+    return get_classification_prompt().split("Examples:")[0].rstrip() + "\n"
+
+def get_classification_examples():
+    """Parse the labelled example bank out of the classification prompt"""
+    examples = {}
+    category = None
+    for line in get_classification_prompt().splitlines():
+        line = line.strip()
+        heading = re.fullmatch(r"\*\*(\w+)\*\*", line)
+        if heading and heading.group(1) in CLASSIFICATION_CATEGORIES:
+            category = heading.group(1)
+            examples[category] = []
+            continue
+        item = re.match(r"\d+\.\s+(.+)", line)
+        if category and item:
+            examples[category].append(item.group(1))
+    return examples
+
 def get_duckduckgo_prompt():
     return [
         "You are a search agent that uses DuckDuckGo to find relevant web information about a user's question.",
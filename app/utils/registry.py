@@ -0,0 +1,89 @@
+import os
+import threading
+from typing import Any, Callable, Hashable
+import httpx
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "120"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "120"))
+
+
+class ResourceRegistry:
+    """Process-wide store of expensive, shareable objects built once on first use.
+
+    Modules stay imported across Streamlit reruns and sessions, so anything
+    registered here (LLM clients, connection pools, agent templates, search
+    wrappers) is constructed once per process. Only stateless or thread-safe
+    objects belong here; per-request objects are copied from templates.
+    """
+
+    def __init__(self):
+        self._resources = {}
+        self._lock = threading.RLock()
+        self.created = 0
+        self.reused = 0
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        resource = self._resources.get(key)
+        if resource is not None:
+            self.reused += 1
+            return resource
+        # Re-entrant so factories can resolve their own dependencies from the registry
+        with self._lock:
+            resource = self._resources.get(key)
+            if resource is None:
+                resource = factory()
+                self._resources[key] = resource
+                self.created += 1
+            else:
+                self.reused += 1
+            return resource
+
+    def replace(self, key: Hashable, resource: Any):
+        """Register resource under key, in place of anything built before"""
+        with self._lock:
+            self._resources[key] = resource
+
+    def discard(self, key: Hashable):
+        """Forget the resource under key so the next get_or_create builds it again"""
+        with self._lock:
+            self._resources.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._resources.clear()
+
+    def stats(self) -> dict:
+        return {
+            "resources": len(self._resources),
+            "created": self.created,
+            "reused": self.reused
+        }
+
+
+registry = ResourceRegistry()
+
+
+def _build_http_client() -> httpx.Client:
+    client = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        ),
+        timeout=HTTP_TIMEOUT
+    )
+    try:
+        # CrewAI sends agent LLM calls through LiteLLM, which reuses this session when set
+        import litellm
+        if litellm.client_session is None:
+            litellm.client_session = client
+    except ImportError:
+        pass
+    return client
+
+
+def shared_http_client() -> httpx.Client:
+    """Keep-alive connection pool shared by every LLM client in the process"""
+    return registry.get_or_create(("http_client",), _build_http_client)
@@ -0,0 +1,105 @@
+import json
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+from app.utils.metrics import metrics
+from app.utils.prompts import CLASSIFICATION_CATEGORIES
+
+SEARCH_PROVIDERS = ("duckduckgo", "tavily")
+
+# Classify first and run only the search agents the category's plan asks for
+ADAPTIVE_ROUTING = os.getenv("ADAPTIVE_ROUTING", "true").lower() in ("1", "true", "yes")
+
+# Search providers per category; PIPELINE_PLANS='{"Definition": ["tavily"]}' overrides.
+# Calculations and puzzles are answered by the coordinator alone
+PIPELINE_PLANS: Dict[str, Tuple[str, ...]] = {
+    "Mathematical": (),
+    "Analytical": (),
+    "Definition": ("duckduckgo",),
+    "Formulation": ("duckduckgo",),
+    "Inferential": ("tavily",),
+    "Inference": ("tavily",),
+    "Differentiation": SEARCH_PROVIDERS,
+    "Statistical": SEARCH_PROVIDERS,
+    **{category: tuple(providers) for category, providers in json.loads(os.getenv("PIPELINE_PLANS", "{}")).items()}
+}
+
+
+class PipelineRouter:
+    """Picks the search providers for a category and reports what each plan saved.
+
+    Savings are measured against the runs that used every search provider, so the
+    report fills in once at least one full-pipeline question has been analysed.
+    """
+
+    def __init__(self, plans: Dict[str, Tuple[str, ...]] = PIPELINE_PLANS, enabled: bool = ADAPTIVE_ROUTING):
+        for category, providers in plans.items():
+            unknown = set(providers) - set(SEARCH_PROVIDERS)
+            if category not in CLASSIFICATION_CATEGORIES or unknown:
+                raise ValueError(f"Invalid pipeline plan {category}: {list(providers)}")
+        self.plans = plans
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._runs: Dict[str, dict] = defaultdict(lambda: {"runs": 0, "seconds": 0.0, "llm_calls": 0, "tool_calls": 0,
+                                                           "searches_skipped": 0})
+        self._full = {"runs": 0, "seconds": 0.0, "llm_calls": 0, "tool_calls": 0}
+
+    def plan(self, category: Optional[str]) -> Tuple[str, ...]:
+        """Search providers to run for a category; unknown categories get the full pipeline"""
+        if not self.enabled or category is None:
+            return SEARCH_PROVIDERS
+        return self.plans.get(category, SEARCH_PROVIDERS)
+
+    def record(self, category: Optional[str], providers: Tuple[str, ...], trace: dict):
+        """Account one finished analysis against its category and plan"""
+        spans = trace.get("spans", [])
+        outcome = {
+            "runs": 1,
+            "seconds": trace.get("seconds") or 0.0,
+            "llm_calls": sum(1 for span in spans if span["stage"] == "llm_call"),
+            # Agent tool calls arrive as tool spans, federated provider queries as search spans
+            "tool_calls": sum(1 for span in spans if span["stage"] in ("tool", "search"))
+        }
+        category = category or "Unclassified"
+        skipped = len(SEARCH_PROVIDERS) - len(providers)
+        metrics.inc("routed_analyses_total", 1, category=category, plan="+".join(providers) or "none")
+        metrics.inc("search_agents_skipped_total", skipped, category=category)
+        with self._lock:
+            # Full-pipeline runs of a category routed elsewhere (routing disabled) only feed the baseline
+            if skipped or tuple(providers) == self.plans.get(category, SEARCH_PROVIDERS):
+                stats = self._runs[category]
+                for key, value in outcome.items():
+                    stats[key] += value
+                stats["searches_skipped"] += skipped
+            if not skipped:
+                for key, value in outcome.items():
+                    self._full[key] += value
+
+    def report(self) -> Dict[str, dict]:
+        """Per-category means and the calls and seconds saved against a full-pipeline run"""
+        with self._lock:
+            full = dict(self._full)
+            runs = {category: dict(stats) for category, stats in self._runs.items()}
+
+        report = {}
+        for category, stats in sorted(runs.items()):
+            count = stats["runs"]
+            entry = {
+                "plan": list(self.plans.get(category, SEARCH_PROVIDERS)),
+                "runs": count,
+                "searches_skipped": stats["searches_skipped"],
+                "mean_seconds": stats["seconds"] / count,
+                "mean_llm_calls": stats["llm_calls"] / count,
+                "mean_tool_calls": stats["tool_calls"] / count
+            }
+            if full["runs"]:
+                for key in ("seconds", "llm_calls", "tool_calls"):
+                    saved = full[key] / full["runs"] - stats[key] / count
+                    entry[f"saved_{key}_per_run"] = saved
+                    entry[f"saved_{key}_total"] = saved * count
+            report[category] = entry
+        return report
+
+
+pipeline_router = PipelineRouter()
@@ -0,0 +1,101 @@
+import re
+import threading
+from typing import Optional, Pattern
+
+# Keywords that make a question with numbers belong to another category
+NON_MATHEMATICAL_KEYWORDS = re.compile(
+    r"\b(average|mean|median|mode|probability|chance|variance|standard deviation|"
+    r"percentile|regression|correlation|confidence interval|histogram|chart|graph|"
+    r"comes next|sequence|pattern|missing number|puzzle|riddle)\b",
+    re.IGNORECASE
+)
+
+# Calculus phrasing where "differentiate" means take a derivative
+CALCULUS_CONTEXT = re.compile(r"with respect to|d/d[a-z]|\b[a-z]\s*\^\s*\d|\b[a-z]\(\s*[a-z]\s*\)", re.IGNORECASE)
+
+
+class ClassificationRule:
+    """A single precompiled keyword rule mapping a question to a category"""
+
+    def __init__(self, name: str, category: str, pattern: Pattern, exclude: Optional[Pattern] = None):
+        self.name = name
+        self.category = category
+        self.pattern = pattern
+        self.exclude = exclude
+
+    def matches(self, question: str) -> bool:
+        if not self.pattern.search(question):
+            return False
+        return not (self.exclude and self.exclude.search(question))
+
+
+# Rules from the classifier prompt, in priority order
+DEFAULT_RULES = [
+    ClassificationRule(
+        "differentiate",
+        "Differentiation",
+        re.compile(r"\bdifferentiate\b", re.IGNORECASE),
+        exclude=CALCULUS_CONTEXT
+    ),
+    ClassificationRule(
+        "define",
+        "Definition",
+        re.compile(r"\bdefine\b", re.IGNORECASE)
+    ),
+    ClassificationRule(
+        "theory",
+        "Definition",
+        re.compile(r"\btheory\b", re.IGNORECASE),
+        exclude=re.compile(r"\b(analy[sz]e|compare|contrast)\b", re.IGNORECASE)
+    ),
+    ClassificationRule(
+        "mathematical",
+        "Mathematical",
+        re.compile(
+            # Arithmetic expressions and equations: "52 * 47", "2x + 3 = 11", "15% of 240"
+            r"\d\s*[-+*/×÷^]\s*\(?\d"
+            r"|[a-z0-9)]\s*=\s*[-a-z0-9(]"
+            r"|\d\s*%\s*of\s*\d"
+            # Calculation verbs applied to numbers
+            r"|\b(calculate|compute|evaluate|solve|square root|log)\b[^.?!]*\d",
+            re.IGNORECASE
+        ),
+        exclude=NON_MATHEMATICAL_KEYWORDS
+    ),
+]
+
+
+class RuleEngine:
+    """Decides unambiguous questions locally before falling back to the LLM classifier"""
+
+    def __init__(self, rules=None):
+        self.rules = list(rules or DEFAULT_RULES)
+        self._lock = threading.Lock()
+        self.evaluated = 0
+        self.short_circuited = 0
+        self.by_rule = {rule.name: 0 for rule in self.rules}
+
+    def classify(self, question: str) -> Optional[str]:
+        """Return the category decided by the first matching rule, or None"""
+        question = str(question)
+        matched = next((rule for rule in self.rules if rule.matches(question)), None)
+
+        with self._lock:
+            self.evaluated += 1
+            if matched:
+                self.short_circuited += 1
+                self.by_rule[matched.name] += 1
+
+        return matched.category if matched else None
+
+    def stats(self) -> dict:
+        """Return how many questions were evaluated and short-circuited"""
+        with self._lock:
+            return {
+                "evaluated": self.evaluated,
+                "short_circuited": self.short_circuited,
+                "by_rule": dict(self.by_rule)
+            }
+
+
+rule_engine = RuleEngine()
@@ -0,0 +1,107 @@
+import os
+import threading
+from typing import Dict, Iterator, Optional, Tuple
+from app.utils.embeddings import normalize_text
+from app.utils.metrics import metrics
+
+# Attach identical concurrent analyses to the run already in flight instead of starting another crew
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "true").lower() in ("1", "true", "yes")
+
+
+class Flight:
+    """One in-flight analysis: its stream events so far and, once finished, its answer.
+
+    Every caller reads the same event list from the start, so a request that
+    attaches mid-run still gets the tokens already streamed.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.followers = 0
+        self.events = []
+        self.done = False
+        self.answer: Optional[str] = None
+        self.error: Optional[Exception] = None
+        self.trace: Optional[dict] = None
+        self._condition = threading.Condition()
+
+    def publish(self, event: dict):
+        with self._condition:
+            self.events.append(event)
+            self._condition.notify_all()
+
+    def finish(self, answer: Optional[str] = None, error: Optional[Exception] = None,
+               trace: Optional[dict] = None):
+        with self._condition:
+            self.answer, self.error, self.trace = answer, error, trace
+            self.done = True
+            self._condition.notify_all()
+
+    def stream(self) -> Iterator[dict]:
+        """Yield every event of the run, blocking for new ones until it finishes"""
+        position = 0
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self.done or position < len(self.events))
+                events = self.events[position:]
+                done = self.done
+            yield from events
+            position += len(events)
+            if done and position == len(self.events):
+                return
+
+    def wait(self) -> str:
+        """Block until the run finishes and return its answer, re-raising its error"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.done)
+        if self.error is not None:
+            raise self.error
+        return self.answer
+
+
+class SingleFlight:
+    """In-flight analyses keyed by normalised question, with counts of the runs they saved"""
+
+    def __init__(self, enabled: bool = SINGLE_FLIGHT):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Flight] = {}
+        self.runs = 0
+        self.coalesced = 0
+
+    def join(self, question: str) -> Tuple[Flight, bool]:
+        """Return the flight for a question and whether the caller leads it and must run the analysis"""
+        key = normalize_text(question)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight(key)
+                self.runs += 1
+            else:
+                flight.followers += 1
+                self.coalesced += 1
+        metrics.inc("analysis_flights_total", role="leader" if leader else "follower")
+        return flight, leader
+
+    def land(self, flight: Flight):
+        """Forget a finished flight; callers arriving afterwards start a new run"""
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        if flight.followers:
+            metrics.inc("analyses_coalesced_total", flight.followers)
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.runs + self.coalesced
+            return {
+                "enabled": self.enabled,
+                "in_flight": len(self._flights),
+                "runs": self.runs,
+                "coalesced": self.coalesced,
+                "coalesced_rate": self.coalesced / requests if requests else 0.0
+            }
+
+
+analysis_flights = SingleFlight()
@@ -0,0 +1,90 @@
+import queue
+import threading
+import time
+import weakref
+from typing import Iterator, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+from crewai.utilities.events import crewai_event_bus
+from crewai.utilities.events.llm_events import LLMStreamChunkEvent
+
+# Agents reason in "Thought:/Action:" steps; only the final answer is shown to users
+FINAL_ANSWER_MARKER = "Final Answer:"
+
+_DONE = object()
+
+# CrewAI LLM instance -> handler receiving its streamed chunks
+_stream_targets = weakref.WeakKeyDictionary()
+_targets_lock = threading.Lock()
+
+
+class TokenStreamHandler(BaseCallbackHandler):
+    """Collects streamed LLM tokens in a thread-safe queue and measures time to first token"""
+
+    def __init__(self, final_answer_only: bool = True):
+        self.final_answer_only = final_answer_only
+        self.queue = queue.Queue()
+        self.started_at = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.token_count = 0
+        self._buffer = ""
+        self._answer_started = not final_answer_only
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        if not self._answer_started:
+            # Hold tokens back until the agent starts its final answer
+            self._buffer += token
+            marker = self._buffer.find(FINAL_ANSWER_MARKER)
+            if marker == -1:
+                return
+            self._answer_started = True
+            token = self._buffer[marker + len(FINAL_ANSWER_MARKER):].lstrip()
+            if not token:
+                return
+
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.token_count += 1
+        self.queue.put(token)
+
+    @property
+    def streamed(self) -> bool:
+        return self.token_count > 0
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    def close(self):
+        """Signal consumers that no more tokens will arrive"""
+        self.queue.put(_DONE)
+
+    def tokens(self) -> Iterator[str]:
+        """Yield tokens as they arrive until the handler is closed"""
+        while True:
+            token = self.queue.get()
+            if token is _DONE:
+                return
+            yield token
+
+
+def attach_stream_handler(llm, handler: BaseCallbackHandler):
+    """Enable streaming on a CrewAI LLM and forward its chunks to a LangChain callback handler.
+
+    CrewAI converts LangChain chat models into its own LLM class and drops their
+    callbacks, so chunks are taken from CrewAI's event bus instead.
+    """
+    llm.stream = True
+    with _targets_lock:
+        # A provider-routed LLM streams through whichever of its providers answers
+        for target in (llm, *getattr(llm, "candidates", {}).values()):
+            _stream_targets[target] = handler
+
+
+@crewai_event_bus.on(LLMStreamChunkEvent)
+def _forward_stream_chunk(source, event: LLMStreamChunkEvent):
+    with _targets_lock:
+        handler = _stream_targets.get(source) if source is not None else None
+    if handler is not None and event.chunk:
+        handler.on_llm_new_token(event.chunk)
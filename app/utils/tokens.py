@@ -0,0 +1,40 @@
+from functools import lru_cache
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # The encoding is downloaded on first use; offline hosts fall back to an estimate
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Count prompt tokens with tiktoken, or estimate them at four characters per token"""
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens tokens, marking the cut with an ellipsis"""
+    if max_tokens <= 0:
+        return ""
+    encoding = _encoding()
+    if encoding is None:
+        cut = text[:max_tokens * 4]
+    else:
+        tokens = encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        cut = encoding.decode(tokens[:max_tokens - 1])
+    return cut if cut == text else cut.rstrip() + "…"
+
+
+def encoding_available() -> bool:
+    """Whether counts are exact tiktoken counts rather than the four-characters-per-token estimate"""
+    return _encoding() is not None
@@ -1,7 +1,12 @@
+from abc import abstractmethod
 from crewai.tools import BaseTool
 from langchain_community.tools import DuckDuckGoSearchResults, TavilySearchResults
-from typing import Type
+from typing import List, Type
 from pydantic import BaseModel, Field
+from app.utils.cache import search_cache
+from app.utils.metrics import span
+from app.utils.registry import registry
+import json
 import os
 from dotenv import load_dotenv
 
@@ -15,8 +20,76 @@ class TavilySearchInput(BaseModel):
     """Input schema for Tavily search."""
     query: str = Field(..., description="Search query to look up")
 
-class DuckDuckGoSearchTool(BaseTool):
+# Optional (tool name, query, search) -> result hook around every search, e.g. for record/replay
+search_interceptor = None
+
+def _as_result(result, url_key: str, snippet_key: str) -> dict:
+    """Normalise a provider result to a title/url/snippet dict"""
+    if not isinstance(result, dict):
+        return {"title": "No title", "url": "", "snippet": str(result)}
+    return {
+        "title": result.get("title") or "No title",
+        "url": result.get(url_key) or "",
+        "snippet": result.get(snippet_key) or ""
+    }
+
+class SearchTool(BaseTool):
+    """Base for the web search tools; subclasses implement fetch and format_result."""
+    provider: str = ""
+
+    def _run(self, query: str) -> str:
+        """Execute the search and return results."""
+        # Agent attribution comes from CrewAI's tool events; this times the provider call
+        with span("search", attach=False, tool=self.name):
+            if search_interceptor is not None:
+                return search_interceptor(self.name, query, self._search)
+            return self._search(query)
+
+    def _search(self, query: str) -> str:
+        """Execute the search and return formatted results."""
+        cached = search_cache.get(self.name, query)
+        if cached is not None:
+            return cached
+        
+        try:
+            results = self.fetch(query)
+        except Exception as e:
+            return f"Error performing {self.provider} search: {str(e)}"
+        
+        if not results:
+            return "No results found for the given query."
+        
+        # Format results for better readability
+        formatted = "\n".join(self.format_result(i, result) for i, result in enumerate(results, 1))
+        search_cache.set(self.name, query, formatted)
+        return formatted
+
+    def search_results(self, query: str) -> List[dict]:
+        """Cached title/url/snippet results for the federated search stage; raises on provider errors."""
+        with span("search", tool=self.name):
+            if search_interceptor is not None:
+                return search_interceptor(f"{self.name}:results", query, self._cached_fetch)
+            return self._cached_fetch(query)
+
+    def _cached_fetch(self, query: str) -> List[dict]:
+        cached = search_cache.get(f"{self.name}:results", query)
+        if cached is not None:
+            return json.loads(cached)
+        results = self.fetch(query)
+        search_cache.set(f"{self.name}:results", query, json.dumps(results))
+        return results
+
+    @abstractmethod
+    def fetch(self, query: str) -> List[dict]:
+        """Query the provider and return title/url/snippet results."""
+
+    @abstractmethod
+    def format_result(self, number: int, result: dict) -> str:
+        """Render one numbered result for the agent."""
+
+class DuckDuckGoSearchTool(SearchTool):
     name: str = "duckduckgo_search"
+    provider: str = "DuckDuckGo"
     description: str = (
         "Search the web using DuckDuckGo. "
         "Useful for finding current information, news, and general web content. "
@@ -24,32 +97,20 @@ class DuckDuckGoSearchTool(BaseTool):
     )
     args_schema: Type[BaseModel] = DuckDuckGoSearchInput
 
-    def _run(self, query: str) -> str:
-        """Execute the search and return results."""
-        try:
-            search = DuckDuckGoSearchResults(num_results=5)
-            results = search.invoke(query)
-            
-            if not results:
-                return "No results found for the given query."
-            
-            # Format results for better readability
-            formatted_results = []
-            for i, result in enumerate(results, 1):
-                if isinstance(result, dict):
-                    title = result.get('title', 'No title')
-                    link = result.get('link', 'No link')
-                    snippet = result.get('snippet', 'No description')
-                    formatted_results.append(f"{i}. **{title}**\n   Link: {link}\n   Description: {snippet}\n")
-                else:
-                    formatted_results.append(f"{i}. {str(result)}\n")
-            
-            return "\n".join(formatted_results)
-        except Exception as e:
-            return f"Error performing DuckDuckGo search: {str(e)}"
+    def fetch(self, query: str) -> List[dict]:
+        """Query DuckDuckGo and return title/url/snippet results."""
+        search = registry.get_or_create(
+            ("search", "duckduckgo"),
+            lambda: DuckDuckGoSearchResults(max_results=5, output_format="list")
+        )
+        return [_as_result(result, "link", "snippet") for result in search.invoke(query) or []]
+
+    def format_result(self, number: int, result: dict) -> str:
+        return f"{number}. **{result['title']}**\n   Link: {result['url'] or 'No link'}\n   Description: {result['snippet'] or 'No description'}\n"
 
-class TavilySearchTool(BaseTool):
+class TavilySearchTool(SearchTool):
     name: str = "tavily_search"
+    provider: str = "Tavily"
     description: str = (
         "Search the web using Tavily Search API. "
         "Provides high-quality search results with AI-powered summarization. "
@@ -58,37 +119,31 @@ class TavilySearchTool(BaseTool):
     )
     args_schema: Type[BaseModel] = TavilySearchInput
 
-    def _run(self, query: str) -> str:
-        """Execute the Tavily search and return results."""
-        try:
-            tavily_api_key = os.getenv("TAVILY_API_KEY")
-            if not tavily_api_key:
-                return "Tavily API key not found. Please set TAVILY_API_KEY environment variable."
-            
-            search = TavilySearchResults(
+    def fetch(self, query: str) -> List[dict]:
+        """Query Tavily and return title/url/snippet results."""
+        tavily_api_key = os.getenv("TAVILY_API_KEY")
+        if not tavily_api_key:
+            raise ValueError("Tavily API key not found. Please set TAVILY_API_KEY environment variable.")
+        
+        search = registry.get_or_create(
+            ("search", "tavily", tavily_api_key),
+            lambda: TavilySearchResults(
                 max_results=5,
                 api_wrapper_kwargs={"api_key": tavily_api_key}
             )
-            results = search.invoke(query)
-            
-            if not results:
-                return "No results found for the given query."
-            
-            # Format results for better readability
-            formatted_results = []
-            for i, result in enumerate(results, 1):
-                if isinstance(result, dict):
-                    title = result.get('title', 'No title')
-                    url = result.get('url', 'No URL')
-                    content = result.get('content', 'No content available')
-                    formatted_results.append(f"{i}. **{title}**\n   URL: {url}\n   Content: {content}\n")
-                else:
-                    formatted_results.append(f"{i}. {str(result)}\n")
-            
-            return "\n".join(formatted_results)
-        except Exception as e:
-            return f"Error performing Tavily search: {str(e)}"
+        )
+        results = search.invoke(query)
+        # The LangChain tool reports API errors as a string instead of raising
+        if isinstance(results, str):
+            raise RuntimeError(results)
+        return [_as_result(result, "url", "content") for result in results or []]
+
+    def format_result(self, number: int, result: dict) -> str:
+        return f"{number}. **{result['title']}**\n   URL: {result['url'] or 'No URL'}\n   Content: {result['snippet'] or 'No content available'}\n"
 
 # Create instances of the tools
 duckduckgo_tool = DuckDuckGoSearchTool()
-tavily_tool = TavilySearchTool()
\ No newline at end of file
+tavily_tool = TavilySearchTool()
+
+# Federated search queries the tools directly, by provider name
+search_tools = {"duckduckgo": duckduckgo_tool, "tavily": tavily_tool}